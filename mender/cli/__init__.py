@@ -21,15 +21,44 @@
 # SOFTWARE.
 import logging
 import argparse
+import importlib
 import os
-
-from mender.cli import deps, devadm, devauth, device, artifacts, inventory, client, user
+import sys
+import time
+from collections import OrderedDict
+
+# first, so that profiling.START is as early as possible
+from mender.cli import profiling
+from mender.cli import logconf
+from mender.cli import utils
+from mender.cli.jsonstream import JSON_FORMATS
 from mender.cli.utils import run_command, CommandNotSupportedError
 from mender.client import ClientError
+from mender.client import retry
+from mender.client import timing
 
-def parse_arguments():
-    parser = argparse.ArgumentParser(description='mender backend client',
-                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+# command name -> (module in mender.cli, help), a command's module is imported
+# only when the command is used, keeping startup fast
+COMMANDS = OrderedDict([
+    ('deployment', ('deps', 'Deployments')),
+    ('artifact', ('artifacts', 'Artifacts')),
+    ('admission', ('devadm', 'Admission')),
+    ('authentication', ('devauth', 'Device Authentication')),
+    ('inventory', ('inventory', 'Inventory')),
+    ('user', ('user', 'User commands')),
+    ('device', ('device', 'Device')),
+    ('client', ('client', 'Simulate a mender client')),
+    ('replay', ('replay', 'Replay recorded device traffic')),
+    ('batch', ('batch', 'Run many commands in one process')),
+])
+
+
+def command_module(command):
+    return importlib.import_module('mender.cli.' + COMMANDS[command][0])
+
+
+def add_global_args(parser):
     parser.add_argument('-d', '--debug', help='Enable debugging output',
                         default=False, action='store_true')
     parser.add_argument('-q', '--quiet', help='Disable any output',
@@ -42,42 +71,79 @@ def parse_arguments():
                         default='')
     parser.add_argument('-u', '--user-token', help='User token file',
                         default='usertoken')
+    parser.add_argument('--retries', help='Number of retries of failed requests',
+                        type=int, default=3)
+    parser.add_argument('--adaptive-concurrency', metavar='MAX', type=int, default=0,
+                        help='Adapt number of concurrent requests to backend response, up to MAX')
+    parser.add_argument('--latency-target', type=float, default=1.0,
+                        help='Request latency (seconds) tolerated by adaptive concurrency')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write pstats profile of the command to FILE')
+    parser.add_argument('--profile-memory', metavar='N', type=int, default=0,
+                        help='With --profile, also write N top memory allocation sites to FILE.memory')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write Chrome trace events of the command to FILE')
+    parser.add_argument('--http-timing', action='store_true', default=False,
+                        help='Record DNS/connect/TLS/TTFB/transfer times of requests, shown with --debug')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Do not use cached responses of list commands')
+    parser.add_argument('--cache-dir', help='Response cache directory',
+                        default=os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                                            os.path.expanduser('~/.cache')),
+                                             'mender-backend'))
+    parser.add_argument('--cache-ttl', type=float, default=60,
+                        help='Seconds to use cached responses the server cannot revalidate')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='Response cache size limit in MiB')
+    parser.add_argument('--json-format', default='pretty', choices=JSON_FORMATS,
+                        help='Format of JSON responses')
+    parser.add_argument('--log-json', action='store_true', default=False,
+                        help='Write log messages as JSON objects')
+    parser.add_argument('--log-rate', type=float, default=20,
+                        help='Messages per second of each kind logged below WARNING, 0 for no limit')
+    parser.add_argument('--log-sample', type=int, default=100,
+                        help='Over --log-rate, log 1 of this many messages, 0 for none')
+
+
+def parse_arguments(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # find out which command is used, only that one needs its arguments
+    # defined
+    pre = argparse.ArgumentParser(add_help=False)
+    add_global_args(pre)
+    # the command and everything after it
+    pre.add_argument('rest', nargs=argparse.REMAINDER)
+    rest = pre.parse_known_args(args)[0].rest
+    selected = rest[0] if rest and rest[0] in COMMANDS else None
+
+    parser = argparse.ArgumentParser(description='mender backend client',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    add_global_args(parser)
     parser.set_defaults(command='')
     sub = parser.add_subparsers(help='Commands')
 
-    pdeps = sub.add_parser('deployment', help='Deployments')
-    deps.add_args(pdeps)
-    pdeps.set_defaults(command='deployment')
-
-    pim = sub.add_parser('artifact', help='Artifacts')
-    artifacts.add_args(pim)
-    pim.set_defaults(command='artifact')
-
-    padm = sub.add_parser('admission', help='Admission')
-    devadm.add_args(padm)
-    padm.set_defaults(command='admission')
-
-    pauth = sub.add_parser('authentication', help='Device Authentication')
-    devauth.add_args(pauth)
-    pauth.set_defaults(command='authentication')
-
-    pinv = sub.add_parser('inventory', help='Inventory')
-    inventory.add_args(pinv)
-    pinv.set_defaults(command='inventory')
+    for name, (_, helptext) in COMMANDS.items():
+        pcmd = sub.add_parser(name, help=helptext)
+        if name == selected:
+            command_module(name).add_args(pcmd)
+        pcmd.set_defaults(command=name)
 
-    puse = sub.add_parser('user', help='User commands')
-    user.add_args(puse)
-    puse.set_defaults(command='user')
+    opts = parser.parse_args(args)
+    # global options as given, for commands running other commands
+    opts.global_args = args[:len(args) - len(rest)] if selected else args
+    return opts
 
-    pdev = sub.add_parser('device', help='Device')
-    device.add_args(pdev)
-    pdev.set_defaults(command='device')
 
-    pclient = sub.add_parser('client', help='Simulate a mender client')
-    client.add_args(pclient)
-    pclient.set_defaults(command='client')
+def run(opts):
+    """Run command selected in `opts`"""
+    opts.verify = not opts.no_verify
+    utils.json_format = opts.json_format
 
-    return parser.parse_args()
+    commands = {}
+    if opts.command:
+        commands[opts.command] = command_module(opts.command).do_main
+    run_command(opts.command, commands, opts)
 
 
 def main():
@@ -90,26 +156,34 @@ def main():
     if opts.quiet:
         level = logging.ERROR
 
-    logging.basicConfig(level=level)
+    listener = logconf.setup(level, json_format=opts.log_json,
+                             rate=opts.log_rate, sample=opts.log_sample)
 
     logging.debug('starting...')
 
-    opts.verify = not opts.no_verify
-
     logging.debug('options: %r', opts)
+
+    if opts.trace:
+        profiling.tracer = profiling.Tracer()
+        timing.listeners.append(profiling.trace_timings)
+        # imports and argument parsing
+        profiling.tracer.add('startup', 'cli', profiling.START, time.perf_counter())
+    profiler = None
+    if opts.profile:
+        profiler = profiling.Profiler(opts.profile_memory)
+        profiler.start()
+
     try:
-        commands = {
-            'deployment': deps.do_main,
-            'admission': devadm.do_main,
-            'authentication': devauth.do_main,
-            'device': device.do_main,
-            'artifact': artifacts.do_main,
-            'inventory': inventory.do_main,
-            'client':  client.do_main,
-            'user':  user.do_main,
-        }
-        run_command(opts.command, commands, opts)
+        with profiling.span('command', command=opts.command):
+            run(opts)
     except ClientError as rerr:
         logging.error('request failed: %s', rerr)
     except CommandNotSupportedError:
         logging.error('incomplete or unsupported command, see --help')
+    finally:
+        logging.debug('requests: %s', retry.stats)
+        if profiler:
+            profiler.stop(opts.profile)
+        if profiling.tracer:
+            profiling.tracer.write(opts.trace)
+        listener.stop()
@@ -25,8 +25,6 @@ import os
 import sys
 from collections import OrderedDict
 
-from requests_toolbelt import MultipartEncoder
-
 from mender.cli.utils import run_command, do_simple_get, api_from_opts, errorprinter
 from mender.client import artifacts_url
 
@@ -72,6 +70,9 @@ def do_main(opts):
 
 
 def do_artifacts_artifact_add(opts):
+    # not needed by other commands, and slow to import
+    from requests_toolbelt import MultipartEncoder
+
     logging.debug('add artifact %r', opts)
     url = artifacts_url(opts.service)
     image = {
@@ -132,5 +133,5 @@ def do_artifacts_show(opts):
 def do_artifacts_list(opts):
     logging.debug('list artifacts')
     url = artifacts_url(opts.service)
-    with api_from_opts(opts) as api:
+    with api_from_opts(opts, cache=True) as api:
         do_simple_get(api, url)
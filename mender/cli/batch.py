@@ -0,0 +1,157 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import logging
+import io
+import json
+import shlex
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from mender.cli import utils
+from mender.client import ClientError
+
+
+def add_args(sub):
+    sub.add_argument('-f', '--file', default='-',
+                     help='File with commands, one per line, - for stdin')
+    sub.add_argument('-j', '--jobs', type=int, default=4,
+                     help='Number of commands to run concurrently')
+
+
+class ThreadOutput(io.TextIOBase):
+    """Stand-in for sys.stdout, redirecting output of each thread to a buffer set
+    with redirect(). Threads without a buffer write to `out`."""
+    def __init__(self, out):
+        self.out = out
+        self.local = threading.local()
+
+    def redirect(self, buf):
+        self.local.buf = buf
+
+    def write(self, data):
+        buf = getattr(self.local, 'buf', None)
+        return (buf or self.out).write(data)
+
+    def flush(self):
+        buf = getattr(self.local, 'buf', None)
+        (buf or self.out).flush()
+
+
+def parse_line(line):
+    """Parse batch input `line`, returns a tuple (ID, command arguments) or None
+    for lines with no command. Lines are either command arguments as in shell,
+    a JSON list of arguments, or a JSON object {"args": [..], "id": ..}"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('['):
+        return None, json.loads(line)
+    if line.startswith('{'):
+        cmd = json.loads(line)
+        return cmd.get('id'), cmd['args']
+    return None, shlex.split(line)
+
+
+def run_one(global_args, args, output):
+    # imported here, mender.cli imports this module
+    from mender.cli import parse_arguments, run
+
+    buf = io.StringIO()
+    output.redirect(buf)
+    result = {'status': 'ok', 'error': None}
+    try:
+        opts = parse_arguments(global_args + args)
+        if opts.command == 'batch':
+            raise utils.CommandNotSupportedError(opts.command)
+        run(opts)
+    except ClientError as err:
+        result.update(status='error', error='request failed: {}'.format(err))
+    except utils.CommandNotSupportedError as err:
+        result.update(status='error', error=str(err))
+    except SystemExit as err:
+        # argparse bails out on invalid command or --help
+        if err.code:
+            result.update(status='error', error='invalid command')
+    except Exception as err:
+        logging.exception('command %s failed', args)
+        result.update(status='error', error=str(err))
+    finally:
+        output.redirect(None)
+    result['output'] = buf.getvalue()
+    return result
+
+
+def do_main(opts):
+    inf = sys.stdin if opts.file == '-' else open(opts.file)
+
+    # all commands share connections and tokens, the latter through the token
+    # cache, commands may run concurrent requests of their own
+    utils.shared_adapter = utils.SharedAdapter(pool_connections=opts.jobs,
+                                               pool_maxsize=max(opts.jobs, 64),
+                                               timing=opts.http_timing)
+    out = sys.stdout
+    output = ThreadOutput(out)
+    sys.stdout = output
+
+    def emit(lineno, cmdid, args, fut):
+        result = dict(line=lineno, args=args, **fut.result())
+        if cmdid is not None:
+            result['id'] = cmdid
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+
+    submitted = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=opts.jobs) as executor:
+            for index, line in enumerate(inf):
+                if line.strip() == 'wait':
+                    # barrier, following commands depend on preceding ones
+                    while submitted:
+                        emit(*submitted.popleft())
+                    continue
+                try:
+                    parsed = parse_line(line)
+                except (ValueError, KeyError) as err:
+                    logging.error('line %d: cannot parse %r: %s', index + 1, line, err)
+                    continue
+                if parsed is None:
+                    continue
+                cmdid, args = parsed
+                submitted.append((index + 1, cmdid, args,
+                                  executor.submit(run_one, opts.global_args,
+                                                  args, output)))
+
+                # results come out in submission order, as soon as possible
+                while submitted and (submitted[0][3].done() or
+                                     len(submitted) > opts.jobs * 4):
+                    emit(*submitted.popleft())
+
+            while submitted:
+                emit(*submitted.popleft())
+    finally:
+        sys.stdout = out
+        utils.shared_adapter.shutdown()
+        utils.shared_adapter = None
+        if inf is not sys.stdin:
+            inf.close()
@@ -19,52 +19,382 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import collections
+import json
 import logging
+import signal
 import time
 import threading
-import random
+import shutil
 import tempfile
 import copy
+from urllib.parse import urlsplit
 
-from mender.cli import device
-from mender.client import ClientNotAuthorizedError
+import requests
+
+from mender.cli import device, keys, recording, replay, scenario, synthetic
+from mender.cli.devstate import DeviceState
+from mender.cli.signing import SigningService
+from mender.client import ClientNotAuthorizedError, timing
+from mender.client.retry import CircuitOpenError, full_jitter, jittered
 
 
 def add_args(sub):
     sub.set_defaults(clientcommand='')
 
-    sub.add_argument('-n', '--number', help="Number of clients", type=int, required=True)
-    sub.add_argument('-i', '--inventory', help="Inventory items", action='append', default=["device_type:fake-device", "image_type:fake-image"])
+    sub.add_argument('-n', '--number', help="Number of clients, required unless --scenario is used", type=int)
+    sub.add_argument('-i', '--inventory', help="Inventory items", action='append', default=scenario.DEFAULT_INVENTORY)
+    sub.add_argument('--inventory-template', metavar='NAME|FILE',
+                     help="Generate device inventory from template, built-in: {}".format(
+                         ', '.join(sorted(synthetic.TEMPLATES))))
     sub.add_argument('--inventory-update-freq', type=int, default=60)
+    sub.add_argument('--inventory-jitter', type=float, default=0.1,
+                     help="Spread inventory reports by +/- this fraction of the period, and start them at a random point of it")
+    sub.add_argument('--inventory-delta', action='store_true', default=False,
+                     help="After the first full report, send only changed inventory attributes")
+    sub.add_argument('--compress-inventory', action='store_true', default=False,
+                     help="Send gzip compressed inventory reports")
     sub.add_argument('-w', '--wait', help="Maximum wait before changing update steps", type=int, default=30)
     sub.add_argument('-f', '--fail', help="Fail update with specific messsage", type=str, default="")
     sub.add_argument('-c', '--updates', help="Number of updates to perform before exiting", type=int, default=1)
+    sub.add_argument('-K', '--key-type', default=keys.DEFAULT_KEY_TYPE, choices=keys.KEY_TYPES,
+                     help="Device key type")
+    sub.add_argument('--crypto-workers', type=int, default=None,
+                     help="Number of processes for key generation and signing, 0 to run in client threads (default: number of CPUs)")
+    sub.add_argument('--scenario', help="Fleet scenario file, overrides -n, -i, --inventory-template, -w, -f and --inventory-update-freq")
+    sub.add_argument('--seed', type=int, default=None,
+                     help="Random seed for reproducible runs, overrides seed of the scenario")
+    sub.add_argument('--record', metavar='FILE',
+                     help="Record requests of devices to FILE, for use with replay command")
+    sub.add_argument('--virtual', action='store_true', default=False,
+                     help="Simulate the fleet on a virtual clock against an in-process fake backend")
+    sub.add_argument('--duration', type=float, default=None,
+                     help="Stop the fleet after this many seconds (default: no limit, 1 day in virtual mode)")
+    sub.add_argument('--fleet-updates', type=int, default=0,
+                     help="Stop the fleet after this many updates completed across all devices")
+    sub.add_argument('--token-lifetime', type=float, default=7 * 24 * 3600,
+                     help="Lifetime of device tokens issued by the fake backend, in virtual mode")
+    sub.add_argument('--deployment-interval', type=float, default=3600,
+                     help="Seconds between deployments to all devices by the fake backend, in virtual mode")
+    sub.add_argument('--admission-delay', type=float, default=0,
+                     help="Seconds before the fake backend accepts a new device, in virtual mode")
+
+
+def load_scenario(opts):
+    if opts.scenario:
+        try:
+            scen = scenario.load(opts.scenario)
+        except (IOError, scenario.ScenarioError) as err:
+            logging.error('failed to load scenario: %s', err)
+            return None
+    elif opts.number:
+        scen = scenario.Scenario([scenario.Cohort.from_opts(opts)])
+    else:
+        logging.error('number of clients or scenario is required')
+        return None
+    if opts.seed is not None:
+        scen.seed = opts.seed
+    return scen
+
+
+def fleet_config(opts, seed, state_dir=None):
+    """Settings shared by all simulated devices, see DeviceState"""
+    config = copy.copy(opts)
+    config.seed = seed
+    config.store = True
+    config.verify = False
+    config.state_dir = state_dir
+    return config
+
+
+class Fleet:
+    """State shared by simulated devices. Setting `stop` makes devices finish
+    an update in progress, without waiting between its steps, and exit. It is
+    set once `target` updates (0 for no limit) completed across the fleet."""
+    def __init__(self, target=0):
+        self.stop = threading.Event()
+        self.target = target
+        self.updates = 0
+        self.failed = 0
+        self.inventory_failures = 0
+        self.lock = threading.Lock()
+
+    def update_done(self):
+        with self.lock:
+            self.updates += 1
+            done = self.target and self.updates >= self.target
+        if done and not self.stop.is_set():
+            logging.info('fleet completed %d updates, stopping', self.updates)
+            self.stop.set()
+
+    def device_failed(self):
+        with self.lock:
+            self.failed += 1
+
+    def inventory_failed(self):
+        with self.lock:
+            self.inventory_failures += 1
+
+
+class FleetStats:
+    """Counts of requests made by simulated devices, per endpoint, fed by
+    response hooks (see device.request_observers). Authorization requests
+    rejected while devices wait for admission are counted as `pending`, not as
+    errors. With --http-timing, also totals of request phase durations, fed
+    by timing.listeners."""
+    PHASES = ['dns', 'connect', 'tls', 'ttfb', 'transfer']
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.auths = 0
+        self.pending = 0
+        self.timed = 0
+        self.reused = 0
+        self.phases = collections.Counter()
+
+    def record(self, dev, rsp):
+        req = rsp.request
+        ep = replay.endpoint(req.method, urlsplit(req.url).path)
+        auth = ep.endswith('/auth_requests')
+        with self.lock:
+            self.requests[ep] += 1
+            if auth and rsp.status_code == 401:
+                self.pending += 1
+            elif rsp.status_code >= 400:
+                self.errors[ep] += 1
+            elif auth:
+                self.auths += 1
+
+    def record_timings(self, request, timings):
+        with self.lock:
+            self.timed += 1
+            self.reused += timings['reused']
+            for name in self.PHASES:
+                # transfer of streamed responses is not known
+                self.phases[name] += timings[name] or 0
+
+    def timing_summary(self):
+        """Mean phase durations in ms and share of reused connections"""
+        if not self.timed:
+            return None
+        summary = {name: round(self.phases[name] * 1000 / self.timed, 3)
+                   for name in self.PHASES}
+        summary['reused'] = round(self.reused / self.timed, 4)
+        return summary
+
+
+def rate(count, seconds, per=60):
+    return round(count * per / seconds, 2) if seconds else None
+
+
+def print_summary(summary):
+    print(json.dumps(summary, indent=4))
+
+
+def fleet_summary(devices, elapsed, fleet, stats):
+    requests = sum(stats.requests.values())
+    errors = sum(stats.errors.values())
+    return {
+        'devices': devices,
+        'failed_devices': fleet.failed,
+        'failed_inventory_reports': fleet.inventory_failures,
+        'seconds': round(elapsed, 3),
+        'updates': fleet.updates,
+        'updates_per_min': rate(fleet.updates, elapsed),
+        'auths': stats.auths,
+        'auths_per_min': rate(stats.auths, elapsed),
+        'pending_admission': stats.pending,
+        'requests': requests,
+        'requests_per_sec': rate(requests, elapsed, per=1),
+        'error_rate': round(errors / requests, 4) if requests else None,
+        'endpoints': {ep: {'requests': count,
+                           'error_rate': round(stats.errors[ep] / count, 4)}
+                      for ep, count in sorted(stats.requests.items())},
+        'http_timing': stats.timing_summary(),
+    }
+
+
+def handle_signals(fleet):
+    """Drain `fleet` on SIGINT or SIGTERM, abort on a second one. Returns the
+    previous handlers."""
+    def handler(signum, frame):
+        if fleet.stop.is_set():
+            raise KeyboardInterrupt
+        logging.warning('draining, finishing updates in progress (signal again to abort)')
+        fleet.stop.set()
+
+    if threading.current_thread() is not threading.main_thread():
+        # e.g. in batch, signals are left to the main thread
+        return {}
+    return {sig: signal.signal(sig, handler) for sig in (signal.SIGINT, signal.SIGTERM)}
 
 
 def do_main(opts):
     threads = []
 
-    client_options = []
-    for _ in range(opts.number):
-        new_opts = copy.deepcopy(opts)
-        new_opts.store = True
-        new_opts.verify = False
-        new_opts.attrs_set = opts.inventory
-        new_opts.mac_address = ":".join(["%02x" % random.randint(0x00, 0xFF) for i in range(6)])
-        new_opts.device_key = tempfile.NamedTemporaryFile().name
-        new_opts.tenant_token = tempfile.NamedTemporaryFile().name
-        new_opts.device_token = tempfile.NamedTemporaryFile().name
-        threads.append(threading.Thread(target=run_client, args=(new_opts,)))
+    scen = load_scenario(opts)
+    if not scen:
+        return
+    logging.info('simulating %d devices, seed %s', scen.size(), scen.seed)
+    fleet = Fleet(opts.fleet_updates)
+
+    if opts.virtual:
+        # imported here, only needed in virtual mode
+        from mender.cli import simulation
+        simulation.do_virtual(opts, scen, fleet)
+        return
+
+    if opts.crypto_workers != 0:
+        device.signing_service = SigningService(opts.crypto_workers)
+
+    state_dir = tempfile.mkdtemp(prefix='mender-client-')
+    config = fleet_config(opts, scen.seed, state_dir)
+    for index, cohort in scen.devices():
+        # daemon, so that aborting does not wait for them
+        threads.append(threading.Thread(target=run_client,
+                                        args=(DeviceState(config, index, cohort), fleet),
+                                        daemon=True))
+
+    stats = FleetStats()
+    device.request_observers.append(stats.record)
+    timing.listeners.append(stats.record_timings)
+    recorder = None
+    if opts.record:
+        recorder = recording.Recorder(opts.record)
+        device.request_observers.append(recorder.record)
+
+    timer = None
+    if opts.duration:
+        timer = threading.Timer(opts.duration, fleet.stop.set)
+        timer.daemon = True
+    previous = handle_signals(fleet)
+    start = time.monotonic()
+    try:
+        if timer:
+            timer.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        elapsed = time.monotonic() - start
+        if timer:
+            timer.cancel()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        device.request_observers.clear()
+        timing.listeners.remove(stats.record_timings)
+        if recorder:
+            recorder.close()
+        if device.signing_service:
+            device.signing_service.shutdown()
+            device.signing_service = None
+        shutil.rmtree(state_dir, ignore_errors=True)
 
-    for t in threads:
-        t.start()
+    print_summary(fleet_summary(scen.size(), elapsed, fleet, stats))
+
+
+def bootstrap(opts, backend, stop):
+    """Authorize with `backend`, yields delays between attempts. Returns False
+    if `stop` was set before authorizing."""
+    logging.info("performing bootstrap")
+    backend.ensure_key(opts)
+
+    attempt = 0
+    while not backend.authorize(opts):
+        if stop.is_set():
+            return False
+        logging.info("device not authorized yet..")
+        # back off, a fleet waiting for admission must not poll in lockstep
+        yield 5 + full_jitter(5, attempt, 55, rng=opts.rng)
+        attempt += 1
+    logging.info("successfully bootstrapped client")
+    return True
+
+
+def device_lifecycle(opts, backend, fleet):
+    """State machine of a simulated device: bootstrap, then go through
+    `opts.updates` updates (0 for no limit), authorizing again whenever the
+    token expires or is lost, and backing off after authorization failures and
+    while the backend circuit breaker is open. Ends early once `fleet` is
+    stopped. Yields delays in seconds, see device.fake_update_steps()."""
+    update_cnt = 0
+    outages = 0
+    rejections = 0
+    while not fleet.stop.is_set():
+        try:
+            # after an outage the device may still hold a valid token
+            if not backend.authorized(opts) and \
+               not (yield from bootstrap(opts, backend, fleet.stop)):
+                return
+            while True:
+                if not (yield from device.fake_update_steps(opts, backend, fleet.stop)):
+                    return
+                update_cnt += 1
+                outages = 0
+                rejections = 0
+                fleet.update_done()
+                if opts.updates and update_cnt >= opts.updates:
+                    return
+                if fleet.stop.is_set():
+                    return
+                if opts.cohort.reauthorize_on_reboot():
+                    raise ClientNotAuthorizedError('token lost in reboot')
+        except ClientNotAuthorizedError as err:
+            logging.info('client authorization expired: %s', err)
+            backend.invalidate(opts)
+            # a backend rejecting fresh tokens must not be hammered
+            yield full_jitter(5, rejections, 55, rng=opts.rng)
+            rejections += 1
+        except CircuitOpenError as err:
+            # the backend is down for the whole fleet, wait it out rather
+            # than give up, an update in progress starts over
+            logging.info('backend unavailable, backing off: %s', err)
+            yield 5 + full_jitter(5, outages, 55, rng=opts.rng)
+            outages += 1
+
+
+def inventory_lifecycle(opts, backend, fleet):
+    """Periodic inventory reports of an authorized device, yields delays.
+    Reports are spread by `opts.inventory_jitter` fraction of the period. With
+    `opts.inventory_delta`, only attributes changed since the last report are
+    sent, and nothing if none changed. Failed reports are counted in `fleet`
+    and retried after a backoff."""
+    freq = opts.inventory_update_freq
+    jitter = opts.inventory_jitter
+    reported = {}
+    failures = 0
+    # start at a random point of the period, devices started together would
+    # report together otherwise
+    yield opts.rng.uniform(0, freq) if jitter else freq
+    while True:
+        if backend.authorized(opts):
+            attrs = opts.cohort.inventory_attrs(opts.index, opts.mac_address, opts.seed)
+            if opts.inventory_delta:
+                attrs = [a for a in attrs if reported.get(a['name']) != a['value']]
+            if attrs:
+                logging.info('inventory report')
+                try:
+                    backend.inventory(opts, attrs)
+                    reported.update((a['name'], a['value']) for a in attrs)
+                    failures = 0
+                except requests.exceptions.RequestException as err:
+                    logging.warning('inventory report failed: %s', err)
+                    fleet.inventory_failed()
+                    yield min(freq, 5 + full_jitter(5, failures, 55, rng=opts.rng))
+                    failures += 1
+                    continue
+        yield jittered(freq, jitter, rng=opts.rng) if jitter else freq
 
 
 class InventoryReporter:
-    def __init__(self, opts):
+    def __init__(self, opts, fleet):
         self.thread = threading.Thread(target=self.send_inventory_data)
         self.stop_event = threading.Event()
         self.opts = opts
+        self.fleet = fleet
 
     def start(self):
         self.thread.start()
@@ -74,53 +404,24 @@ class InventoryReporter:
         self.thread.join()
 
     def send_inventory_data(self):
-        while not self.stop_event.wait(self.opts.inventory_update_freq):
-            logging.info('inventory report')
-            device.do_inventory(self.opts)
+        for delay in inventory_lifecycle(self.opts, device.http_backend, self.fleet):
+            if self.stop_event.wait(delay):
+                break
 
 
-def run_client(opts):
+def run_client(opts, fleet):
     logging.info("starting client with MAC: %s", opts.mac_address)
 
-    need_auth = True
-    update_cnt = 0
-
-    while True:
-        if need_auth:
-            block_until_authorized(opts)
-
-        need_auth = False
-
-        inv = InventoryReporter(opts)
-        inv.start()
-
-        while True:
-            try:
-                block_until_update(opts)
-                update_cnt += 1
-                if opts.updates and update_cnt >= opts.updates:
-                    break
-            except ClientNotAuthorizedError:
-                logging.info('client authorization expired')
-                need_auth = True
-                break
-
+    inv = InventoryReporter(opts, fleet)
+    inv.start()
+    try:
+        for delay in device_lifecycle(opts, device.http_backend, fleet):
+            # returns early once the fleet is stopped, draining devices do not
+            # wait between update steps
+            fleet.stop.wait(delay)
+    except requests.exceptions.RequestException as err:
+        logging.error('client %s failed: %s', opts.mac_address, err)
+        fleet.device_failed()
+    finally:
         logging.info('waiting for inventory reporter')
         inv.stop()
-
-
-def block_until_authorized(opts):
-    logging.info("performing bootstrap")
-    device.do_key(opts)
-
-    while True:
-        if device.do_authorize(opts):
-            logging.info("successfully bootstrapped client")
-            return
-        else:
-            logging.info("device not authorized yet..")
-            time.sleep(5)
-
-
-def block_until_update(opts):
-    return device.do_fake_update(opts)
@@ -20,9 +20,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import logging
+import json
+import os
+import time
+from collections import defaultdict, Counter
 
-from mender.cli.utils import api_from_opts, run_command, do_simple_get, simpleprinter
-from mender.client import deployments_url
+from mender.cli.utils import api_from_opts, run_command, do_simple_get, \
+    do_request, simpleprinter, iter_pages, run_parallel
+from mender.cli.inventory import repack_attrs
+from mender.client import deployments_url, inventory_url
 
 
 def add_args(sub):
@@ -61,17 +67,61 @@ def add_args(sub):
     pdlogs.set_defaults(depcommand='logs')
     pdlogs.add_argument('id', help='Deployment ID')
     pdlogs.add_argument('devid', help='Device ID')
+    # deployment logs for many devices
+    pdcollect = pdsub.add_parser('collect-logs',
+                                 help='Download deployment logs of devices with given status')
+    pdcollect.set_defaults(depcommand='collect-logs')
+    pdcollect.add_argument('id', help='Deployment ID')
+    pdcollect.add_argument('-t', '--status', action='append',
+                           help='Device status to collect logs for, specify multiple times (default: failure)')
+    pdcollect.add_argument('-j', '--jobs', type=int, default=8,
+                           help='Number of concurrent downloads')
+    pdcollect.add_argument('--per-page', type=int, default=500,
+                           help='Page size when listing deployment devices')
+    pdcollectout = pdcollect.add_mutually_exclusive_group(required=True)
+    pdcollectout.add_argument('-o', '--output-dir',
+                              help='Write logs to <device ID>.log files in this directory')
+    pdcollectout.add_argument('--ndjson',
+                              help='Append logs to this file, one JSON object per device')
+    # deployment failure breakdown by inventory attributes
+    pdbreak = pdsub.add_parser('breakdown',
+                               help='Show device statuses broken down by inventory attributes')
+    pdbreak.set_defaults(depcommand='breakdown')
+    pdbreak.add_argument('id', help='Deployment ID')
+    pdbreak.add_argument('-a', '--attribute', action='append', required=True,
+                         help='Inventory attribute to group by, specify multiple times')
+    pdbreak.add_argument('-i', '--inventory-snapshot',
+                         help='Use inventory devices from this JSON/NDJSON file instead of fetching them')
+    pdbreak.add_argument('-j', '--jobs', type=int, default=8,
+                         help='Number of concurrent inventory requests')
+    pdbreak.add_argument('--per-page', type=int, default=500,
+                         help='Page size when listing deployment devices')
+    # deployment watch
+    pdwatch = pdsub.add_parser('watch', help='Watch deployment progress')
+    pdwatch.set_defaults(depcommand='watch')
+    pdwatch.add_argument('id', help='Deployment ID')
+    pdwatch.add_argument('--min-interval', type=float, default=2,
+                         help='Polling interval while deployment is changing (seconds)')
+    pdwatch.add_argument('--max-interval', type=float, default=60,
+                         help='Polling interval ceiling while nothing changes (seconds)')
+    pdwatch.add_argument('--max-failure-rate', type=float, default=None,
+                         help='Stop when failed/total devices exceeds this ratio (0.0-1.0)')
+    pdwatch.add_argument('--no-devices', action='store_true', default=False,
+                         help='Do not fetch and show devices that changed status')
 
 
 def do_main(opts):
     logging.debug('deployment opts: %r', opts)
     cmds = {
         'add': do_deployments_add,
+        'breakdown': do_deployments_breakdown,
+        'collect-logs': do_deployments_collect_logs,
         'devices': do_deployments_devices,
         'find': do_deployments_find,
         'logs': do_deployments_logs,
         'stats': do_deployments_stats,
         'status': do_deployments_status,
+        'watch': do_deployments_watch,
     }
     run_command(opts.depcommand, cmds, opts)
 
@@ -130,3 +180,243 @@ def do_deployments_logs(opts):
                           '{}/devices/{}/log'.format(opts.id, opts.devid))
     with api_from_opts(opts) as api:
         do_simple_get(api, url, printer=simpleprinter)
+
+
+def fetched_logs(opts):
+    """Return a set of IDs of devices whose logs were already collected"""
+    if opts.output_dir:
+        return {name[:-len('.log')] for name in os.listdir(opts.output_dir)
+                if name.endswith('.log')}
+
+    fetched = set()
+    if os.path.exists(opts.ndjson):
+        with open(opts.ndjson) as inf:
+            for line in inf:
+                try:
+                    fetched.add(json.loads(line)['device_id'])
+                except (ValueError, KeyError):
+                    # likely a partial line left by an interrupted run
+                    logging.debug('skipping malformed line: %r', line)
+    return fetched
+
+
+def do_deployments_collect_logs(opts):
+    statuses = opts.status or ['failure']
+    logging.debug('collect logs of deployment %s devices with status %s',
+                  opts.id, statuses)
+    if opts.output_dir:
+        os.makedirs(opts.output_dir, exist_ok=True)
+    skip = fetched_logs(opts)
+    if skip:
+        logging.info('skipping %d already collected logs', len(skip))
+
+    devices_url = deployments_url(opts.service, '{}/devices'.format(opts.id))
+
+    # workers plus the main thread listing devices
+    with api_from_opts(opts, pool_size=opts.jobs + 1) as api:
+        def fetch_log(devid):
+            url = deployments_url(opts.service,
+                                  '{}/devices/{}/log'.format(opts.id, devid))
+            rsp = do_request(api, url, printer=None, success=200)
+            if rsp.status_code != 200:
+                return None
+            return rsp.text
+
+        devids = (dev['id'] for dev in iter_pages(api, devices_url,
+                                                  per_page=opts.per_page)
+                  if dev['status'] in statuses and dev['id'] not in skip)
+
+        outf = open(opts.ndjson, 'a') if opts.ndjson else None
+        collected = 0
+        failed = 0
+        try:
+            # results arrive in the main thread, no locking needed for output
+            for devid, log, err in run_parallel(fetch_log, devids, jobs=opts.jobs):
+                if err or log is None:
+                    logging.warning('failed to fetch log of device %s: %s',
+                                    devid, err or 'request failed')
+                    failed += 1
+                    continue
+
+                if outf:
+                    outf.write(json.dumps({'device_id': devid, 'log': log}) + '\n')
+                    outf.flush()
+                else:
+                    path = os.path.join(opts.output_dir, '{}.log'.format(devid))
+                    with open(path + '.part', 'w') as logf:
+                        logf.write(log)
+                    # rename only once complete, a re-run must not skip partial files
+                    os.replace(path + '.part', path)
+                collected += 1
+        finally:
+            if outf:
+                outf.close()
+
+    print('collected {} logs, {} failed, {} skipped'.format(collected, failed, len(skip)))
+
+
+def load_inventory_snapshot(path):
+    """Load inventory devices from `path`, either a JSON list as returned by the
+    inventory devices API or NDJSON with one device per line. Returns a map of
+    device ID to attributes."""
+    with open(path) as inf:
+        data = inf.read()
+    try:
+        devices = json.loads(data)
+    except ValueError:
+        devices = None
+    # a single device in NDJSON is a JSON object too
+    if not isinstance(devices, list):
+        devices = [json.loads(line) for line in data.splitlines() if line.strip()]
+    return {dev['id']: repack_attrs(dev.get('attributes')) for dev in devices}
+
+
+def join_breakdown(devices, inventory, attributes):
+    """Hash join deployment `devices` (pairs of device ID and status) with
+    `inventory` map of device ID to attributes. Returns a map of attribute name
+    to a map of attribute value to a Counter of device statuses."""
+    breakdown = {attr: defaultdict(Counter) for attr in attributes}
+    for devid, status in devices:
+        attrs = inventory.get(devid, {})
+        for attr in attributes:
+            value = attrs.get(attr, '<undefined>')
+            if isinstance(value, list):
+                # multi-valued attributes cannot be used as keys
+                value = ', '.join(str(v) for v in value)
+            breakdown[attr][value][status] += 1
+    return breakdown
+
+
+def dump_breakdown(breakdown):
+    for attr, values in breakdown.items():
+        print('{}:'.format(attr))
+        print('  {:30} {:>8} {:>8} {:>8}'.format('value', 'total', 'failed', 'rate'))
+        rows = []
+        for value, statuses in values.items():
+            total = sum(statuses.values())
+            rows.append((statuses['failure'] / total, total, statuses['failure'], value))
+        # worst offenders first, values of an attribute may be of mixed types
+        rows.sort(key=lambda row: row[:3] + (str(row[3]),), reverse=True)
+        for rate, total, failed, value in rows:
+            print('  {:30} {:>8} {:>8} {:>7.1%}'.format(str(value), total, failed, rate))
+
+
+def do_deployments_breakdown(opts):
+    logging.debug('breakdown of deployment %s by %s', opts.id, opts.attribute)
+    devices_url = deployments_url(opts.service, '{}/devices'.format(opts.id))
+
+    with api_from_opts(opts, pool_size=opts.jobs) as api:
+        devices = [(dev['id'], dev['status'])
+                   for dev in iter_pages(api, devices_url, per_page=opts.per_page)]
+
+        if opts.inventory_snapshot:
+            inventory = load_inventory_snapshot(opts.inventory_snapshot)
+        else:
+            def fetch_attrs(devid):
+                url = inventory_url(opts.service, '/devices/{}'.format(devid))
+                rsp = do_request(api, url, printer=None, success=200)
+                if rsp.status_code != 200:
+                    return {}
+                return repack_attrs(rsp.json().get('attributes'))
+
+            inventory = {}
+            for devid, attrs, err in run_parallel(fetch_attrs,
+                                                  {devid for devid, _ in devices},
+                                                  jobs=opts.jobs):
+                if err:
+                    logging.warning('failed to fetch inventory of device %s: %s',
+                                    devid, err)
+                    continue
+                inventory[devid] = attrs
+
+    dump_breakdown(join_breakdown(devices, inventory, opts.attribute))
+
+
+# device statuses of a deployment that is still in progress
+ACTIVE_STATUSES = ['pending', 'downloading', 'installing', 'rebooting']
+
+
+def stats_delta(prev, cur):
+    """Return a list of (status, old count, new count) for statuses whose count
+    changed between `prev` and `cur` statistics"""
+    delta = []
+    for status in sorted(set(prev.keys()) | set(cur.keys())):
+        old, new = prev.get(status, 0), cur.get(status, 0)
+        if old != new:
+            delta.append((status, old, new))
+    return delta
+
+
+def devices_moved(prev, cur):
+    """Return a list of (device ID, old status, new status) for devices whose
+    status differs between `prev` and `cur` maps of device ID to status"""
+    return [(devid, prev.get(devid, '<none>'), status)
+            for devid, status in sorted(cur.items())
+            if prev.get(devid) != status]
+
+
+def deployment_done(stats):
+    total = sum(stats.values())
+    active = sum(stats.get(status, 0) for status in ACTIVE_STATUSES)
+    return total > 0 and active == 0
+
+
+def failure_rate(stats):
+    total = sum(stats.values())
+    if not total:
+        return 0.0
+    return stats.get('failure', 0) / total
+
+
+def do_deployments_watch(opts):
+    logging.debug('watch deployment %s', opts.id)
+    stats_url = deployments_url(opts.service, '{}/statistics'.format(opts.id))
+    devices_url = deployments_url(opts.service, '{}/devices'.format(opts.id))
+
+    stats = {}
+    devices = {}
+    interval = opts.min_interval
+    # reuse a single session, and with it the connection, for all polls
+    with api_from_opts(opts) as api:
+        try:
+            while True:
+                rsp = do_request(api, stats_url, printer=None, success=200)
+                if rsp.status_code != 200:
+                    return
+                cur = rsp.json()
+
+                delta = stats_delta(stats, cur)
+                if delta:
+                    print('[{}] {}'.format(time.strftime('%H:%M:%S'),
+                                           ', '.join('{}: {} -> {} ({:+d})'.format(status, old, new,
+                                                                                     new - old)
+                                                     for status, old, new in delta)))
+                    # device list is only needed when something moved
+                    if not opts.no_devices:
+                        rsp = do_request(api, devices_url, printer=None, success=200)
+                        if rsp.status_code == 200:
+                            curdevs = {dev['id']: dev['status'] for dev in rsp.json()}
+                            if devices:
+                                for devid, old, new in devices_moved(devices, curdevs):
+                                    print('    device {}: {} -> {}'.format(devid, old, new))
+                            devices = curdevs
+                    stats = cur
+                    # state is in transition, poll eagerly
+                    interval = opts.min_interval
+                else:
+                    interval = min(interval * 2, opts.max_interval)
+
+                if deployment_done(stats):
+                    print('deployment finished')
+                    return
+
+                rate = failure_rate(stats)
+                if opts.max_failure_rate is not None and rate > opts.max_failure_rate:
+                    print('failure rate {:.1%} exceeds {:.1%}, stopping'.format(rate,
+                                                                          opts.max_failure_rate))
+                    return
+
+                logging.debug('next poll in %.1fs', interval)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logging.info('watch interrupted')
@@ -24,9 +24,7 @@ from binascii import hexlify
 
 import requests
 
-from Crypto.PublicKey import RSA
-from Crypto.Hash import SHA
-
+from mender.cli import keys
 from mender.cli.utils import run_command, api_from_opts, do_request, do_simple_get
 from mender.client import admissions_url
 
@@ -62,10 +60,7 @@ def do_main(opts):
 
 
 def fingerprint(key):
-    k = RSA.importKey(key).exportKey('DER')
-    h = SHA.new()
-    h.update(k)
-    return h.digest()
+    return keys.fingerprint(key)
 
 
 def slice_n(seq, n):
@@ -86,7 +86,7 @@ def show_device(opts):
 
 
 def list_devices(opts):
-    with api_from_opts(opts) as api:
+    with api_from_opts(opts, cache=True) as api:
         do_simple_get(api, authentication_url(opts.service, '/devices'),
                       printer=lambda rsp: [dump_device_brief(dev)
                                            for dev in rsp.json()])
@@ -19,22 +19,35 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import gzip
 import logging
 import json
 import time
 import random
 import tempfile
 import os
-from base64 import b64encode
-
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
-from Crypto.Hash import SHA256
 
+import requests
 
+from mender.cli import keys, profiling, synthetic
+from mender.cli.scenario import Cohort
 from mender.cli.utils import run_command, api_from_opts, do_simple_get, do_request, \
-    errorprinter, jsonprinter, dump_token, load_file, save_file
-from mender.client import device_url, JWTAuth
+    errorprinter, jsonprinter, dump_token, load_file, save_file, TokenCache
+from mender.client import device_url, JWTAuth, ClientError, ClientNotAuthorizedError
+
+
+# device tokens, keyed by token path
+device_tokens = TokenCache()
+
+# signed authorization requests, keyed by (key path, MAC, tenant token)
+signed_auth_requests = {}
+
+# SigningService to offload crypto to, if any
+signing_service = None
+
+# callables called with (device MAC, response) for every device request, see
+# observe_requests()
+request_observers = []
 
 
 def add_args(sub):
@@ -44,6 +57,8 @@ def add_args(sub):
     sub.add_argument('-k', '--device-key', help='Device key path',
                      default='key.priv')
     sub.add_argument('-o', '--device-token', default='devtoken', help='Device token path')
+    sub.add_argument('-K', '--key-type', default=keys.DEFAULT_KEY_TYPE,
+                     choices=keys.KEY_TYPES, help='Device key type, used when generating a key')
 
     pupdate = pdev.add_parser('update', help='Get update')
     pupdate.set_defaults(devcommand='update')
@@ -51,7 +66,16 @@ def add_args(sub):
     pdevattr = pdev.add_parser('inventory', help='Send device attributes')
     pdevattr.add_argument('-s', '--attrs-set',
                           help='Assign attributes, format <name>:<value>, specify multiple times',
-                          action='append', required=True)
+                          action='append', default=[])
+    pdevattr.add_argument('-T', '--template', metavar='NAME|FILE',
+                          help='Generate attributes from synthetic inventory template, built-in: {}'.format(
+                              ', '.join(sorted(synthetic.TEMPLATES))))
+    pdevattr.add_argument('--index', type=int, default=0,
+                          help='Device index for the template')
+    pdevattr.add_argument('--seed', type=int, default=None,
+                          help='Seed for the template')
+    pdevattr.add_argument('-z', '--compress', action='store_true', default=False,
+                          help='Send gzip compressed request body')
     pdevattr.set_defaults(devcommand='inventory')
 
     pauthorize = pdev.add_parser('authorize', help='Authorize')
@@ -87,41 +111,49 @@ def do_main(opts):
     }
     run_command(opts.devcommand, commands, opts)
 
-def gen_privkey():
-    private = RSA.generate(1024)
-    return private.exportKey()
+def gen_privkey(key_type=keys.DEFAULT_KEY_TYPE):
+    return keys.gen_privkey(key_type)
+
+def import_privkey(pem):
+    return keys.import_key(pem)
 
 def load_privkey(path):
     priv = load_file(path)
-    return RSA.importKey(priv)
+    return import_privkey(priv)
 
 def sign(data, key):
-    signer = PKCS1_v1_5.new(key)
-    digest = SHA256.new()
-    digest.update(data.encode())
-    signed = signer.sign(digest)
-    return b64encode(signed)
+    return keys.sign(data, key)
 
 def download_image(url, deployment_id, store=False, **kwargs):
-    rsp = do_simple_get(url, stream=True, **kwargs)
+    # images come from storage rather than the API, no device token
+    rsp = do_simple_get(requests, url, printer=lambda rsp: None, stream=True, **kwargs)
     logging.debug('status %s', rsp.status_code)
-    if rsp.status_code == 200:
-        if store:
-            with tempfile.NamedTemporaryFile(prefix=deployment_id[0:8], dir=os.getcwd()) as f:
-                for chunk in rsp.iter_content(chunk_size=1024):
-                    if chunk:
-                        f.write(chunk)
-    else:
-        logging.error('failed to download image from %s: %s', url, rsp.text)
+    with rsp:
+        if rsp.status_code == 200:
+            if store:
+                with tempfile.NamedTemporaryFile(prefix=deployment_id[0:8], dir=os.getcwd()) as f:
+                    for chunk in rsp.iter_content(chunk_size=1024):
+                        if chunk:
+                            f.write(chunk)
+        else:
+            logging.error('failed to download image from %s: %s', url, rsp.text)
 
-def do_authorize(opts):
-    url = device_url(opts.service, '/authentication/auth_requests')
+def signed_auth_request(opts):
+    """Return a tuple (data, signature) of authorization request for device
+    described by `opts`. Requests are cached and reused as long as the device
+    key file, identity and tenant token do not change.
 
-    try:
-        key = load_privkey(opts.device_key)
-    except IOError:
-        logging.error('failed to load key from %s', opts.device_key)
-        return
+    Will raise IOError if the key cannot be loaded.
+    """
+    st = os.stat(opts.device_key)
+    stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+    ckey = (opts.device_key, opts.mac_address, opts.tenant_token)
+    cached = signed_auth_requests.get(ckey)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    pem = load_file(opts.device_key)
+    key = import_privkey(pem)
 
     identity = json.dumps({
         'mac': opts.mac_address,
@@ -129,24 +161,44 @@ def do_authorize(opts):
     logging.debug('identity: %s', identity)
     data = json.dumps({
         'id_data': identity,
-        'pubkey': str(key.publickey().exportKey(), 'utf-8'),
+        'pubkey': keys.export_pubkey(key),
         'tenant_token': opts.tenant_token,
     })
     logging.debug('request data: %s', data)
-    signature = sign(data, key)
+    if signing_service:
+        signature = signing_service.sign(data, pem)
+    else:
+        signature = sign(data, key)
+
+    signed_auth_requests[ckey] = (stamp, (data, signature))
+    return data, signature
+
+
+def do_authorize(opts):
+    url = device_url(opts.service, '/authentication/auth_requests')
+
+    try:
+        data, signature = signed_auth_request(opts)
+    except IOError:
+        logging.error('failed to load key from %s', opts.device_key)
+        return
+
     hdrs = {
         'X-MEN-Signature': signature,
         'Content-Type': 'application/json'
     }
-    with api_from_opts(opts) as api:
-        rsp = api.post(url,
-                       data=data,
-                       headers=hdrs)
+    with observe_requests(api_from_opts(opts), opts) as api:
+        # resending the same signed request is harmless
+        with profiling.span('auth_request', 'network', url=url):
+            rsp = api.post(url,
+                           data=data,
+                           headers=hdrs,
+                           idempotent=True)
 
         if rsp.status_code == 200:
-            logging.info('request successful')
-            logging.info('token: %s', rsp.text)
+            logging.info('request successful, token saved to %s', opts.device_token)
             save_file(opts.device_token, rsp.text)
+            device_tokens.put(opts.device_token, rsp.text)
             return True
         else:
             logging.warning('request failed: %s %s', rsp, rsp.text)
@@ -154,25 +206,61 @@ def do_authorize(opts):
 
 
 def do_key(opts):
-    logging.info('generating new key, writing to %s', opts.device_key)
-    priv = gen_privkey()
+    logging.info('generating new %s key, writing to %s', opts.key_type,
+                 opts.device_key)
+    if signing_service:
+        priv = signing_service.gen_privkey(opts.key_type)
+    else:
+        priv = gen_privkey(opts.key_type)
     save_file(opts.device_key, priv)
 
 
-def do_inventory(opts):
-    url = device_url(opts.service, '/inventory/device/attributes')
-
-    # prepare attributes
+def parse_attrs(attrs_set):
+    """Parse list of <name>:<value> strings into inventory attributes"""
     attrs = []
-    for attr in opts.attrs_set:
-        n, v = attr.split(':')
+    for attr in attrs_set:
+        n, v = attr.split(':', 1)
         attrs.append({'name': n.strip(), 'value': v.strip()})
+    return attrs
+
+
+def send_inventory(opts, attrs, quiet=False, compress=False):
+    """Send inventory attributes `attrs`, a list of {name, value}, optionally
+    with gzip compressed body. Returns the response."""
+    url = device_url(opts.service, '/inventory/device/attributes')
+    if compress:
+        body = {
+            'data': gzip.compress(json.dumps(attrs).encode()),
+            'headers': {'Content-Type': 'application/json',
+                        'Content-Encoding': 'gzip'},
+        }
+    else:
+        body = {'json': attrs}
 
     with device_api_from_opts(opts) as api:
-        do_request(api, url, method='PATCH', json=attrs)
+        return do_request(api, url, method='PATCH',
+                          printer=None if quiet else jsonprinter, **body)
 
 
-def do_update(opts):
+def do_inventory(opts):
+    attrs = parse_attrs(opts.attrs_set)
+    if opts.template:
+        try:
+            tmpl = synthetic.load_template(opts.template)
+        except (IOError, synthetic.TemplateError) as err:
+            logging.error('failed to load template: %s', err)
+            return
+        names = set(a['name'] for a in attrs)
+        # explicitly set attributes take precedence
+        attrs = [a for a in tmpl.attributes(opts.index, seed=opts.seed)
+                 if a['name'] not in names] + attrs
+    if not attrs:
+        logging.error('no attributes, use --attrs-set or --template')
+        return
+    send_inventory(opts, attrs, compress=opts.compress)
+
+
+def do_update(opts, quiet=False):
     def updateprinter(rsp):
         if rsp.status_code == 204:
             print('no update available')
@@ -183,7 +271,7 @@ def do_update(opts):
 
     url = device_url(opts.service, '/deployments/device/deployments/next')
     with device_api_from_opts(opts) as api:
-        return do_simple_get(api, url, printer=updateprinter,
+        return do_simple_get(api, url, printer=None if quiet else updateprinter,
                              success=[200, 204])
 
 def do_token(opts):
@@ -197,60 +285,152 @@ def do_token(opts):
     dump_token(tok)
 
 
-def do_fake_update(opts):
-    logging.info('fake update')
+def fake_update_steps(opts, backend, stop=None):
+    """Poll `backend` for an update and go through it, reporting status on the
+    way. This is a generator yielding delays in seconds, the caller is expected
+    to sleep that long, on a real or virtual clock, before resuming it. Returns
+    True once the update is done, or False if polling ended because `stop`
+    event was set.
+
+    Raises ClientNotAuthorizedError when the device token is about to expire
+    or was rejected.
+    """
+    # devices simulated by client carry their cohort and random generator
+    cohort = getattr(opts, 'cohort', None) or Cohort.from_opts(opts)
+    rng = getattr(opts, 'rng', None) or random
     while True:
-        resp = do_update(opts)
-        if resp.status_code == 200:
+        update = backend.next_update(opts)
+        if update is not None:
             break
-        else:
-            logging.info("No update available..")
-        time.sleep(5)
+        logging.info("No update available..")
+        if stop is not None and stop.is_set():
+            return False
+        if backend.token_expiring(opts):
+            # renew before the token expires rather than wait for a 401
+            raise ClientNotAuthorizedError('device token about to expire')
+        yield cohort.delay('poll', rng)
 
-    deployment_id = resp.json()["id"]
-    deployment_image_uri = resp.json()["image"]["uri"]
+    logging.info("Update: %s available", update["id"])
 
-    logging.info("Update: " + deployment_id + " available")
+    with backend.deployment(opts, update) as dep:
+        dep.status("installing")
+        dep.download()
 
-    url = device_url(opts.service,
-                     '/deployments/device/deployments/%s/status' % deployment_id)
+        dep.status("downloading")
+        yield cohort.delay('downloading', rng)
 
-    with device_api_from_opts(opts) as api:
-        do_request(api, url, method='PUT', json={"status": "installing"})
-
-        download_image(deployment_image_uri,
-                       deployment_id=deployment_id, store=opts.store)
-
-        do_request(api, url, method='PUT', json={"status": "downloading"})
-        time.sleep(random.randint(0, int(opts.wait)))
-
-        do_request(api, url, method='PUT', json={"status": "rebooting"})
-        time.sleep(random.randint(0, int(opts.wait)))
-
-        if opts.fail:
-            do_request(api, url, method='PUT', json={"status": "failure"})
-            logsurl = device_url(opts.service,
-                                 '/deployments/device/deployments/%s/log' % deployment_id)
-            do_request(api, logsurl, method='PUT',
-                       json={
-                           "messages": [
-                               {
-                                   "level": "debug",
-                                   "message": opts.fail,
-                                   "timestamp": "2012-11-01T22:08:41+00:00"
-                               }
-                           ]
-                       })
+        dep.status("rebooting")
+        yield cohort.delay('rebooting', rng)
+
+        if cohort.fails(rng):
+            dep.status("failure")
+            dep.log(cohort.failure_message)
         else:
-            do_request(api, url, method='PUT',
-                       json={"status": "success"})
+            dep.status("success")
+    return True
+
+
+def do_fake_update(opts):
+    logging.info('fake update')
+    for delay in fake_update_steps(opts, http_backend):
+        time.sleep(delay)
+
+
+class HttpDeployment:
+    """Deployment in progress, reported over HTTP in one session"""
+    def __init__(self, opts, update):
+        self.opts = opts
+        self.update = update
+        self.url = device_url(opts.service,
+                              '/deployments/device/deployments/%s/' % update["id"])
+        self.api = device_api_from_opts(opts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.api.close()
+
+    def status(self, status):
+        do_request(self.api, self.url + 'status', method='PUT',
+                   json={"status": status}, printer=None)
+
+    def download(self):
+        download_image(self.update["image"]["uri"],
+                       deployment_id=self.update["id"], store=self.opts.store,
+                       verify=self.opts.verify)
+
+    def log(self, message):
+        do_request(self.api, self.url + 'log', method='PUT', printer=None,
+                   json={
+                       "messages": [
+                           {
+                               "level": "debug",
+                               "message": message,
+                               "timestamp": "2012-11-01T22:08:41+00:00"
+                           }
+                       ]
+                   })
+
+
+class HttpBackend:
+    """Device side of the backend API, used by fake update and client
+    simulator. See simulation.FakeBackend for an in-process counterpart."""
+    def ensure_key(self, opts):
+        # re-authorization reuses the key, the device identity stays the same
+        if not os.path.exists(opts.device_key):
+            do_key(opts)
+
+    def authorize(self, opts):
+        return do_authorize(opts)
+
+    def authorized(self, opts):
+        return device_tokens.get(opts.device_token) is not None
+
+    def invalidate(self, opts):
+        device_tokens.invalidate(opts.device_token)
+
+    def token_expiring(self, opts):
+        return token_expiring(opts)
+
+    def next_update(self, opts):
+        rsp = do_update(opts, quiet=True)
+        if rsp.status_code == 200:
+            return rsp.json()
+        return None
+
+    def deployment(self, opts, update):
+        return HttpDeployment(opts, update)
+
+    def inventory(self, opts, attrs):
+        rsp = send_inventory(opts, attrs, quiet=True, compress=opts.compress_inventory)
+        if rsp.status_code not in [200, 204]:
+            raise ClientError(rsp)
+
+
+http_backend = HttpBackend()
+
+
+def token_expiring(opts):
+    cached = device_tokens.get(opts.device_token)
+    return cached is not None and cached.expiring()
+
+
+def observe_requests(api, opts):
+    """Pass responses to requests made with `api` to request_observers"""
+    if request_observers:
+        dev = getattr(opts, 'mac_address', None)
+        for observe in request_observers:
+            api.hooks['response'].append(
+                lambda rsp, *args, observe=observe, **kwargs: observe(dev, rsp))
+    return api
 
 
 def device_api_from_opts(opts):
-    api = api_from_opts(opts)
+    api = observe_requests(api_from_opts(opts), opts)
 
-    if os.path.exists(opts.device_token):
-        token = load_file(opts.device_token)
-        api.auth = JWTAuth(token)
+    cached = device_tokens.get(opts.device_token)
+    if cached is not None:
+        api.auth = JWTAuth(cached.token)
 
     return api
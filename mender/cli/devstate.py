@@ -0,0 +1,140 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Compact state of simulated devices"""
+import math
+import os
+import random
+
+from mender.cli.synthetic import mix, MASK64
+
+
+class DeviceRandom:
+    """Small random generator (splitmix64) with the part of random.Random API
+    used by simulated devices. random.Random carries 2.5kB of state, too much
+    for each device of a large fleet."""
+    __slots__ = ['state']
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.state = seed & MASK64
+
+    def getrandbits(self, k):
+        bits = 0
+        for _ in range(0, k, 64):
+            self.state = (self.state + 1) & MASK64
+            bits = (bits << 64) | mix(self.state)
+        return bits >> (-k % 64)
+
+    def random(self):
+        return self.getrandbits(53) * (1.0 / (1 << 53))
+
+    def _randbelow(self, n):
+        # rejection sampling, unbiased unlike taking the modulo
+        k = n.bit_length()
+        r = self.getrandbits(k)
+        while r >= n:
+            r = self.getrandbits(k)
+        return r
+
+    def randrange(self, start, stop=None, step=1):
+        if stop is None:
+            start, stop = 0, start
+        if step == 0:
+            raise ValueError('zero step for randrange()')
+        count = (stop - start + step - (1 if step > 0 else -1)) // step
+        if count <= 0:
+            raise ValueError('empty range for randrange({}, {}, {})'.format(start, stop, step))
+        return start + step * self._randbelow(count)
+
+    def randint(self, a, b):
+        return self.randrange(a, b + 1)
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def normalvariate(self, mu=0.0, sigma=1.0):
+        # Box-Muller, the second value of the pair is dropped, keeping it would
+        # take another slot
+        u = 1.0 - self.random()
+        return mu + sigma * math.sqrt(-2.0 * math.log(u)) * math.cos(2.0 * math.pi * self.random())
+
+    def expovariate(self, lambd=1.0):
+        return -math.log(1.0 - self.random()) / lambd
+
+
+def device_rng(seed, index):
+    """Random generator of device `index`, unseeded if `seed` is None"""
+    if seed is None:
+        return DeviceRandom()
+    return DeviceRandom(mix(mix(seed & MASK64) ^ index))
+
+
+class DeviceState:
+    """Simulated device `index` of `cohort`. Settings common to the fleet are
+    looked up in `config`, shared by all devices, so that a device takes a few
+    slots rather than a copy of all options. Key and token files are kept in
+    `config.state_dir`."""
+    __slots__ = ['config', 'index', 'cohort', 'rng', 'mac']
+
+    def __init__(self, config, index, cohort):
+        self.config = config
+        self.index = index
+        self.cohort = cohort
+        self.rng = device_rng(config.seed, index)
+        self.mac = self.rng.getrandbits(48)
+
+    def __getattr__(self, name):
+        # only called for names that are not slots or properties
+        if name == 'config':
+            raise AttributeError(name)
+        return getattr(self.config, name)
+
+    @property
+    def mac_address(self):
+        return ':'.join('%02x' % ((self.mac >> shift) & 0xff)
+                        for shift in range(40, -8, -8))
+
+    @property
+    def updates(self):
+        if self.cohort.updates is not None:
+            return self.cohort.updates
+        return self.config.updates
+
+    @property
+    def inventory_update_freq(self):
+        return self.cohort.inventory_update_freq
+
+    def state_path(self, suffix):
+        return os.path.join(self.config.state_dir, '{}.{}'.format(self.index, suffix))
+
+    @property
+    def device_key(self):
+        return self.state_path('key')
+
+    @property
+    def device_token(self):
+        return self.state_path('token')
+
+    @property
+    def tenant_token(self):
+        return self.state_path('tenant')
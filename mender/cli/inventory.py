@@ -20,9 +20,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import logging
+import os
+import sys
 
 from mender.cli.utils import run_command, api_from_opts, do_simple_get, \
-    do_request, errorprinter, jsonprinter
+    do_request, errorprinter, jsonprinter, iter_pages, run_parallel, \
+    NDJSONWriter, TableWriter
 from mender.client import inventory_url
 
 
@@ -63,8 +66,33 @@ def add_args(sub):
 
     pg = pgrsub.add_parser('show', help='Show group devices')
     pg.add_argument('group', help='Group ID')
+    pg.add_argument('-e', '--expand', action='store_true', default=False,
+                    help='Show attributes of group devices')
+    pg.add_argument('-a', '--attributes', default="id, updated",
+                    help='Csv attribute list to show with --expand')
+    pg.add_argument('-f', '--format', default='plain', choices=['plain', 'ndjson'],
+                    help='Output format with --expand')
+    pg.add_argument('-j', '--jobs', type=int, default=16,
+                    help='Number of concurrent requests with --expand')
+    pg.add_argument('--per-page', type=int, default=500,
+                    help='Page size when listing group devices')
     pg.set_defaults(invgrcommand='show')
 
+    for name, helptext in [('assign', 'Assign many devices to group'),
+                           ('remove', 'Remove many devices from group')]:
+        pgbulk = pgrsub.add_parser(name, help=helptext)
+        pgbulk.add_argument('group', help='Group ID')
+        pgbulksrc = pgbulk.add_mutually_exclusive_group(required=True)
+        pgbulksrc.add_argument('--file',
+                               help='File with device IDs, one per line, - for stdin')
+        pgbulksrc.add_argument('--from-group',
+                               help='Use devices of this group')
+        pgbulk.add_argument('-j', '--jobs', type=int, default=16,
+                            help='Number of concurrent requests')
+        pgbulk.add_argument('--journal',
+                            help='Checkpoint journal path (default: group-<command>-<group>.journal)')
+        pgbulk.set_defaults(invgrcommand=name)
+
 
 def do_main(opts):
     commands = {
@@ -87,6 +115,8 @@ def do_group(opts):
     commands = {
         'list': group_list,
         'show': group_show,
+        'assign': group_bulk,
+        'remove': group_bulk,
     }
     run_command(opts.invgrcommand, commands, opts)
 
@@ -112,7 +142,8 @@ def device_show(opts):
     url = inventory_url(opts.service, '/devices/{}'.format(opts.device))
 
     with api_from_opts(opts) as api:
-        rsp = do_simple_get(api, url)
+        # body is needed after printing
+        rsp = do_simple_get(api, url, stream=False)
         logging.debug("%r", rsp.status_code)
 
         dump_device_attributes(rsp.json())
@@ -171,11 +202,132 @@ def devices_list(opts):
 
 def group_list(opts):
     url = inventory_url(opts.service, 'groups')
-    with api_from_opts(opts) as api:
+    with api_from_opts(opts, cache=True) as api:
         do_simple_get(api, url)
 
 
 def group_show(opts):
     url = inventory_url(opts.service, 'groups/{}/devices'.format(opts.group))
+    if opts.expand:
+        return group_show_expanded(opts, url)
     with api_from_opts(opts) as api:
         do_simple_get(api, url)
+
+
+def device_row(dev, attributes):
+    attrs = repack_attrs(dev.get('attributes'))
+    row = {}
+    for attribute in attributes:
+        if attribute == 'id':
+            row[attribute] = dev['id']
+        elif attribute == 'updated':
+            row[attribute] = dev['updated_ts']
+        else:
+            row[attribute] = attrs.get(attribute, '<undefined>')
+    return row
+
+
+def group_show_expanded(opts, url):
+    attributes = [attribute.strip() for attribute in opts.attributes.split(',')]
+    if opts.format == 'ndjson':
+        writer = NDJSONWriter()
+    else:
+        writer = TableWriter(attributes)
+
+    # devices seen during this run, membership pages may overlap if the group
+    # changes while being listed
+    cache = {}
+
+    # workers plus the main thread listing group members
+    with api_from_opts(opts, pool_size=opts.jobs + 1) as api:
+        def fetch_device(devid):
+            devurl = inventory_url(opts.service, '/devices/{}'.format(devid))
+            rsp = do_request(api, devurl, printer=None, success=200)
+            if rsp.status_code != 200:
+                return None
+            return rsp.json()
+
+        def members():
+            for devid in iter_pages(api, url, per_page=opts.per_page):
+                if devid not in cache:
+                    cache[devid] = None
+                    yield devid
+
+        for devid, dev, err in run_parallel(fetch_device, members(), jobs=opts.jobs):
+            if err or dev is None:
+                logging.warning('failed to fetch device %s: %s', devid,
+                                err or 'request failed')
+                continue
+            cache[devid] = dev
+            if opts.format == 'ndjson':
+                writer.write(dev)
+            else:
+                writer.write(device_row(dev, attributes))
+
+
+def read_device_ids(path):
+    """Generator yielding device IDs listed in `path`, one per line"""
+    inf = sys.stdin if path == '-' else open(path)
+    try:
+        for line in inf:
+            devid = line.strip()
+            if devid and not devid.startswith('#'):
+                yield devid
+    finally:
+        if inf is not sys.stdin:
+            inf.close()
+
+
+def group_bulk(opts):
+    journal = opts.journal or 'group-{}-{}.journal'.format(opts.invgrcommand,
+                                                           opts.group)
+    done = set()
+    if os.path.exists(journal):
+        with open(journal) as inf:
+            done = {line.strip() for line in inf if line.strip()}
+        logging.info('resuming, %d devices already done according to %s',
+                     len(done), journal)
+
+    with api_from_opts(opts, pool_size=opts.jobs + 1) as api:
+        def change_group(devid):
+            if opts.invgrcommand == 'assign':
+                url = inventory_url(opts.service, '/devices/{}/group'.format(devid))
+                rsp = do_request(api, url, method='PUT', success=204,
+                                 json={'group': opts.group})
+            else:
+                url = inventory_url(opts.service,
+                                    '/devices/{}/group/{}'.format(devid, opts.group))
+                rsp = do_request(api, url, method='DELETE', success=204)
+            return rsp.status_code == 204
+
+        if opts.file:
+            devids = read_device_ids(opts.file)
+        else:
+            url = inventory_url(opts.service, 'groups/{}/devices'.format(opts.from_group))
+            # membership changes while devices are processed, shifting pages
+            # under offset paging, read the whole group first
+            devids = list(iter_pages(api, url))
+
+        ok = 0
+        failed = 0
+        # journal is written from the main thread only, as results come in
+        with open(journal, 'a') as journalf:
+            for devid, success, err in run_parallel(change_group,
+                                                    (devid for devid in devids
+                                                     if devid not in done),
+                                                    jobs=opts.jobs):
+                if err or not success:
+                    logging.warning('failed to %s device %s: %s', opts.invgrcommand,
+                                    devid, err or 'request failed')
+                    failed += 1
+                    continue
+                journalf.write(devid + '\n')
+                journalf.flush()
+                ok += 1
+
+    print('{} devices done, {} failed, {} skipped'.format(ok, failed, len(done)))
+    if failed:
+        print('re-run the same command to retry, journal: {}'.format(journal))
+    else:
+        # all done, a later run must start from scratch
+        os.remove(journal)
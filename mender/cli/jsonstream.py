@@ -0,0 +1,173 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+JSON_FORMATS = ['pretty', 'compact', 'ndjson']
+
+WHITESPACE = ' \t\r\n'
+# characters of numbers, true, false and null
+SCALAR = frozenset('0123456789+-.eEtruefalsn')
+
+
+class JSONReformatter:
+    """Incremental JSON reformatter. Text fed with feed() is tokenized and written
+    to `out` right away, so memory use does not depend on the size of the
+    document. Supported formats:
+
+    pretty  - indented like json.dumps(indent=4)
+    compact - no whitespace
+    ndjson  - elements of top level list in compact format, one per line; any
+              other document is written in compact format on a single line
+
+    Input is not fully validated, a document that is not JSON is detected
+    early, while a malformed one may be partially written before a ValueError
+    is raised.
+    """
+    def __init__(self, out, mode='pretty', indent=4):
+        if mode not in JSON_FORMATS:
+            raise ValueError('unsupported format {}'.format(mode))
+        self.write = out.write
+        self.pretty = mode == 'pretty'
+        self.ndjson = mode == 'ndjson'
+        self.indent = ' ' * indent
+        self.key_sep = ': ' if self.pretty else ':'
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.in_scalar = False
+        # opened a container, don't know yet whether it is empty
+        self.pending_open = False
+        # splitting top level list into lines
+        self.split = False
+
+    def newline(self):
+        self.write('\n' + self.indent * self.depth)
+
+    def value_start(self, c):
+        if not self.started:
+            if c not in '{["' and c not in SCALAR:
+                raise ValueError('not a JSON document')
+            self.started = True
+        elif self.depth == 0 and not self.split:
+            raise ValueError('trailing data after JSON document')
+        if self.pending_open:
+            self.pending_open = False
+            if self.pretty:
+                self.newline()
+
+    def open(self, c):
+        if self.ndjson and not self.started and c == '[':
+            self.started = True
+            self.split = True
+            self.depth = 1
+            self.pending_open = True
+            return
+        self.value_start(c)
+        self.write(c)
+        self.depth += 1
+        self.pending_open = True
+
+    def close(self, c):
+        if self.depth == 0:
+            raise ValueError('unexpected {}'.format(c))
+        self.depth -= 1
+        if self.split and self.depth == 0:
+            if not self.pending_open:
+                # end of last element
+                self.write('\n')
+            return
+        if self.pending_open:
+            # empty container
+            self.pending_open = False
+        elif self.pretty:
+            self.newline()
+        self.write(c)
+
+    def comma(self):
+        if self.split and self.depth == 1:
+            self.write('\n')
+            return
+        self.write(',')
+        if self.pretty:
+            self.newline()
+
+    def feed(self, text):
+        i = 0
+        n = len(text)
+        while i < n:
+            if self.in_string:
+                if self.escape:
+                    self.write(text[i])
+                    self.escape = False
+                    i += 1
+                    continue
+                quote = text.find('"', i)
+                bslash = text.find('\\', i, n if quote == -1 else quote)
+                if bslash != -1:
+                    self.write(text[i:bslash + 1])
+                    self.escape = True
+                    i = bslash + 1
+                elif quote == -1:
+                    self.write(text[i:])
+                    return
+                else:
+                    self.write(text[i:quote + 1])
+                    self.in_string = False
+                    i = quote + 1
+                continue
+
+            c = text[i]
+            if c in SCALAR:
+                j = i + 1
+                while j < n and text[j] in SCALAR:
+                    j += 1
+                if not self.in_scalar:
+                    self.value_start(c)
+                    self.in_scalar = True
+                self.write(text[i:j])
+                i = j
+                continue
+
+            self.in_scalar = False
+            if c in WHITESPACE:
+                pass
+            elif c == '"':
+                self.value_start(c)
+                self.write(c)
+                self.in_string = True
+            elif c in '{[':
+                self.open(c)
+            elif c in '}]':
+                self.close(c)
+            elif c == ',':
+                self.comma()
+            elif c == ':':
+                self.write(self.key_sep)
+            else:
+                raise ValueError('unexpected character {!r}'.format(c))
+            i += 1
+
+    def finish(self):
+        if self.in_string or self.depth or not self.started:
+            raise ValueError('truncated JSON document')
+        if not self.split:
+            self.write('\n')
@@ -0,0 +1,123 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import logging
+from base64 import b64encode
+
+from mender.cli import profiling
+
+# Crypto is imported by the functions using it, loading it is costly and most
+# commands do not need it
+
+
+KEY_TYPES = ['rsa:1024', 'rsa:2048', 'rsa:3072', 'ecdsa-p256', 'ed25519']
+DEFAULT_KEY_TYPE = 'rsa:1024'
+
+
+def ecc():
+    # EC keys are only supported by pycryptodome
+    try:
+        from Crypto.PublicKey import ECC
+    except ImportError:
+        raise UnsupportedKeyTypeError('EC keys require pycryptodome')
+    return ECC
+
+
+class UnsupportedKeyTypeError(ValueError):
+    """Indicates that key type is not supported"""
+    pass
+
+
+def gen_privkey(key_type=DEFAULT_KEY_TYPE):
+    """Generate a private key of `key_type`, one of KEY_TYPES, returns the key
+    in PEM format"""
+    from Crypto.PublicKey import RSA
+    logging.debug('generating %s key', key_type)
+    with profiling.span('gen_privkey', 'crypto', key_type=key_type):
+        if key_type.startswith('rsa:'):
+            return RSA.generate(int(key_type[len('rsa:'):])).exportKey()
+        elif key_type == 'ecdsa-p256':
+            return ecc().generate(curve='P-256').export_key(format='PEM').encode()
+        elif key_type == 'ed25519':
+            return ecc().generate(curve='Ed25519').export_key(format='PEM').encode()
+    raise UnsupportedKeyTypeError('unsupported key type {}'.format(key_type))
+
+
+def is_rsa(key):
+    from Crypto.PublicKey import RSA
+    return isinstance(key, RSA.RsaKey) if hasattr(RSA, 'RsaKey') else \
+        isinstance(key, RSA._RSAobj)
+
+
+def import_key(pem):
+    """Import private or public key in PEM format"""
+    from Crypto.PublicKey import RSA
+    try:
+        return RSA.importKey(pem)
+    except ValueError:
+        return ecc().import_key(pem)
+
+
+def export_pubkey(key):
+    """Export public part of `key` in PEM format, returns a string"""
+    if is_rsa(key):
+        return str(key.publickey().exportKey(), 'utf-8')
+    return key.public_key().export_key(format='PEM')
+
+
+def sign(data, key):
+    with profiling.span('sign', 'crypto'):
+        return sign_data(data, key)
+
+
+def sign_data(data, key):
+    """Sign string `data` with `key`, returns Base64 encoded signature. RSA keys
+    use PKCS#1 v1.5 with SHA256, ECDSA uses SHA256 with DER encoded signature,
+    Ed25519 signs the data directly."""
+    from Crypto.Signature import PKCS1_v1_5
+    from Crypto.Hash import SHA256
+    if is_rsa(key):
+        signer = PKCS1_v1_5.new(key)
+        digest = SHA256.new()
+        digest.update(data.encode())
+        return b64encode(signer.sign(digest))
+
+    if key.curve == 'Ed25519':
+        from Crypto.Signature import eddsa
+        return b64encode(eddsa.new(key, 'rfc8032').sign(data.encode()))
+
+    from Crypto.Signature import DSS
+    digest = SHA256.new()
+    digest.update(data.encode())
+    return b64encode(DSS.new(key, 'fips-186-3', encoding='der').sign(digest))
+
+
+def fingerprint(key):
+    """Return SHA1 digest of DER encoded public key `key` given in PEM format"""
+    from Crypto.Hash import SHA
+    k = import_key(key)
+    if is_rsa(k):
+        der = k.exportKey('DER')
+    else:
+        der = k.export_key(format='DER')
+    h = SHA.new()
+    h.update(der)
+    return h.digest()
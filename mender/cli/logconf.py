@@ -0,0 +1,145 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Logging setup.
+
+Records go through a queue to a background thread that formats and writes
+them, so that threads of a large simulated fleet do not block on output.
+Repetitive messages are rate limited and sampled.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """Rate limit messages below `level` per kind, that is logger, level and
+    format string. Each kind may log `rate` messages per second, in bursts of
+    up to `burst`. Over the limit, 1 of `sample` messages passes (none if 0),
+    with the number of messages suppressed before it in `suppressed`."""
+    # more kinds than this means messages are formatted before logging, start
+    # over rather than grow
+    MAX_KINDS = 10000
+
+    def __init__(self, rate=20, burst=100, sample=100, level=logging.WARNING,
+                 clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self.level = level
+        self.clock = clock
+        # kind -> [tokens, last update, suppressed]
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = self.clock()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.MAX_KINDS:
+                    self.buckets.clear()
+                bucket = self.buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+            else:
+                bucket[0] = tokens
+                bucket[2] += 1
+                if not self.sample or bucket[2] % self.sample:
+                    return False
+                # sampled, the message itself is not suppressed
+                bucket[2] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += ' [{} similar suppressed]'.format(suppressed)
+        return text
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as JSON objects, one per line"""
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler leaving all formatting to the listener thread. Records
+    stay within the process, there is no need to make them picklable.
+    Arguments of a message are formatted later, they are expected not to
+    change after logging."""
+    def prepare(self, record):
+        return record
+
+
+def setup(level, json_format=False, rate=20, burst=100, sample=100, stream=None):
+    """Set up root logger at `level` to write to `stream` (stderr by default)
+    from a background thread, in JSON if `json_format`. Messages below WARNING
+    are rate limited unless `rate` is 0, see RateLimitFilter. Returns the
+    QueueListener, stop it to flush the remaining records."""
+    output = logging.StreamHandler(stream)
+    if json_format:
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(TextFormatter(logging.BASIC_FORMAT))
+
+    records = queue.SimpleQueue()
+    handler = LogQueueHandler(records)
+    if rate:
+        handler.addFilter(RateLimitFilter(rate, burst, sample))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    return listener
@@ -0,0 +1,170 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# process start, as close to it as it gets
+START = time.perf_counter()
+
+
+class Tracer:
+    """Collects spans of time as Chrome trace events, the output can be loaded in
+    chrome://tracing or Perfetto"""
+    def __init__(self):
+        self.pid = os.getpid()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name, cat, start, end, args=None):
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start - START) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def write(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as outf:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, outf)
+        logging.info('trace of %d events written to %s', len(events), path)
+
+
+# tracer in use, if any
+tracer = None
+
+
+@contextmanager
+def _span(name, cat, args):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.add(name, cat, start, time.perf_counter(), args)
+
+
+class _NoSpan:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name, cat='cli', **args):
+    """Context manager recording a span `name` of category `cat`, `args` are
+    attached to the event. Costs next to nothing when tracing is disabled."""
+    if tracer is None:
+        return NO_SPAN
+    return _span(name, cat, args)
+
+
+def trace_timings(request, timings):
+    """Listener of timed requests (see mender.client.timing.listeners) adding
+    their phases to the trace, back to back and ending now"""
+    if tracer is None:
+        return
+    phases = [(name, timings[name]) for name in ['dns', 'connect', 'tls', 'ttfb', 'transfer']
+              if timings[name]]
+    start = time.perf_counter() - sum(d for _, d in phases)
+    for name, duration in phases:
+        tracer.add(name, 'http', start, start + duration,
+                   {'method': request.method, 'url': request.url})
+        start += duration
+
+
+# since Python 3.12 cProfile is built on sys.monitoring, a single profiler
+# sees all threads and no other one can be enabled along with it
+PER_THREAD = sys.version_info < (3, 12)
+
+
+class Profiler:
+    """cProfile based profiler covering all threads started while profiling, with
+    optional tracking of `memory_top` top memory allocation sites. Before
+    Python 3.12 each new thread gets a profiler of its own, results are
+    merged."""
+    def __init__(self, memory_top=0):
+        self.memory_top = memory_top
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def _enable(self):
+        prof = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(prof)
+        prof.enable()
+
+    def _thread_start(self, frame, event, arg):
+        # first profiler event of a new thread, replace with cProfile
+        sys.setprofile(None)
+        self._enable()
+
+    def start(self):
+        if self.memory_top:
+            import tracemalloc
+            tracemalloc.start()
+        if PER_THREAD:
+            threading.setprofile(self._thread_start)
+        self._enable()
+
+    def stop(self, path):
+        if PER_THREAD:
+            threading.setprofile(None)
+        if self.memory_top:
+            # before processing the profile allocates plenty
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            mempath = path + '.memory'
+            with open(mempath, 'w') as outf:
+                for stat in snapshot.statistics('lineno')[:self.memory_top]:
+                    outf.write('{}\n'.format(stat))
+            logging.info('top memory allocations written to %s', mempath)
+
+        with self._lock:
+            profiles = list(self.profiles)
+        # threads still running keep profiling, but their data so far is
+        # included
+        profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for prof in profiles[1:]:
+            stats.add(prof)
+        stats.dump_stats(path)
+        logging.info('profile of %d threads written to %s', len(profiles), path)
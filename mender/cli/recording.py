@@ -0,0 +1,112 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Recording of simulated device traffic, see `replay` command.
+
+A trace is gzip compressed NDJSON. Each request is a line:
+
+    {"t": 1.25, "device": "de:ad:be:ef:00:01", "method": "PUT",
+     "path": "/api/devices/v1/...", "status": 204, "latency": 0.012,
+     "size": 24, "hash": "<sha1 of body>", "headers": {...}}
+
+where `t` is seconds since the start of recording. A request body is stored
+once, in a {"body": "<sha1>", "data": "<base64>"} line preceding the first
+request using it. Only headers needed to repeat the request are kept, the
+device token is not.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+
+# request headers kept in the trace
+RECORDED_HEADERS = ['Content-Type', 'X-MEN-Signature']
+
+class Recorder:
+    """Writes trace of requests to `path`"""
+    def __init__(self, path):
+        self.out = gzip.open(path, 'wt')
+        self.lock = threading.Lock()
+        self.bodies = set()
+        self.start = time.monotonic()
+        self.count = 0
+
+    def record(self, device, rsp):
+        req = rsp.request
+        latency = rsp.elapsed.total_seconds()
+        now = time.monotonic()
+        body = req.body or b''
+        if isinstance(body, str):
+            body = body.encode()
+        elif not isinstance(body, bytes):
+            # streamed upload, size is all that is known
+            body = b''
+        digest = hashlib.sha1(body).hexdigest() if body else None
+        url = urlsplit(req.url)
+        event = {
+            't': round(now - latency - self.start, 6),
+            'device': device,
+            'method': req.method,
+            'path': urlunsplit(('', '', url.path, url.query, '')),
+            'status': rsp.status_code,
+            'latency': round(latency, 6),
+            'size': len(body),
+            'hash': digest,
+            'headers': {},
+        }
+        for h in RECORDED_HEADERS:
+            val = req.headers.get(h)
+            if val is not None:
+                # signature is passed as bytes
+                event['headers'][h] = val.decode() if isinstance(val, bytes) else val
+        with self.lock:
+            if self.out.closed:
+                return
+            if digest and digest not in self.bodies:
+                self.bodies.add(digest)
+                self.out.write(json.dumps({'body': digest,
+                                           'data': base64.b64encode(body).decode()}) + '\n')
+            self.out.write(json.dumps(event) + '\n')
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.out.close()
+        logging.info('recorded %d requests', self.count)
+
+
+def read_trace(path):
+    """Yield requests recorded in trace at `path`, with the request body set
+    in 'body'"""
+    bodies = {}
+    with gzip.open(path, 'rt') as inf:
+        for line in inf:
+            event = json.loads(line)
+            if 'body' in event:
+                bodies[event['body']] = base64.b64decode(event['data'])
+                continue
+            event['body'] = bodies.get(event['hash'], b'') if event['hash'] else b''
+            yield event
@@ -0,0 +1,161 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import collections
+import logging
+import re
+import threading
+import time
+
+from mender.cli import recording
+from mender.cli.utils import api_from_opts, run_parallel, TableWriter
+from mender.client import add_url_path
+
+
+def speed(val):
+    """Parse replay speed: N or Nx for N times the recorded rate, max for no
+    pauses between requests (returned as 0)"""
+    if val == 'max':
+        return 0
+    try:
+        factor = float(val.rstrip('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid speed {}'.format(val))
+    if factor <= 0:
+        raise argparse.ArgumentTypeError('speed must be positive')
+    return factor
+
+
+def add_args(sub):
+    sub.add_argument('recording', metavar='FILE',
+                     help='Trace recorded with client --record')
+    sub.add_argument('--speed', type=speed, default=1,
+                     help='Replay speed, N or Nx times the recorded rate or max')
+    sub.add_argument('-j', '--jobs', type=int, default=64,
+                     help='Maximum number of requests in flight')
+
+
+def endpoint(method, path):
+    """Endpoint of request, IDs in the path are replaced with :id"""
+    path = path.split('?', 1)[0]
+    segments = [':id' if re.fullmatch(r'[0-9a-fA-F-]{16,}', seg) else seg
+                for seg in path.split('/')]
+    return '{} {}'.format(method, '/'.join(segments))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class DeviceOrder:
+    """Keeps requests of each device in recorded order. A request waits until
+    the device's previous requests completed. These were submitted earlier, so
+    they are already running."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = collections.Counter()
+
+    def wait(self, device, seq):
+        with self.cond:
+            self.cond.wait_for(lambda: self.done[device] >= seq)
+
+    def finish(self, device):
+        with self.cond:
+            self.done[device] += 1
+            self.cond.notify_all()
+
+
+def paced(events, factor):
+    """Yield `events`, at recorded times scaled by 1/`factor`, or as they come
+    if `factor` is 0. Each event gets its sequence number among requests of the
+    device in 'seq'"""
+    start = time.monotonic()
+    seqs = collections.Counter()
+    for event in events:
+        if factor:
+            delay = start + event['t'] / factor - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        event['seq'] = seqs[event['device']]
+        seqs[event['device']] += 1
+        yield event
+
+
+def do_main(opts):
+    tokens = {}
+    order = DeviceOrder()
+
+    def send(event):
+        device = event['device']
+        order.wait(device, event['seq'])
+        try:
+            headers = dict(event['headers'])
+            if device in tokens:
+                headers['Authorization'] = 'Bearer {}'.format(tokens[device])
+            rsp = api.request(event['method'], add_url_path(opts.service, event['path']),
+                              data=event['body'] or None, headers=headers)
+            if rsp.status_code == 200 and event['path'].endswith('/auth_requests'):
+                tokens[device] = rsp.text
+            return rsp.status_code, rsp.elapsed.total_seconds()
+        finally:
+            order.finish(device)
+
+    recorded = collections.defaultdict(list)
+    replayed = collections.defaultdict(list)
+    errors = collections.Counter()
+    with api_from_opts(opts, pool_size=opts.jobs) as api:
+        # device tokens come from replayed auth requests
+        api.auth = None
+        # retries were recorded as separate requests
+        api.retry = None
+        events = paced(recording.read_trace(opts.recording), opts.speed)
+        for event, result, err in run_parallel(send, events, jobs=opts.jobs):
+            ep = endpoint(event['method'], event['path'])
+            recorded[ep].append(event['latency'])
+            if err:
+                logging.debug('request %s %s failed: %s', event['method'],
+                              event['path'], err)
+                errors[ep] += 1
+                continue
+            status, latency = result
+            replayed[ep].append(latency)
+            if status != event['status']:
+                errors[ep] += 1
+
+    def ms(val):
+        return '-' if val is None else '{:.1f}'.format(val * 1000)
+
+    table = TableWriter(['count', 'mismatch', 'rec p50', 'rec p95', 'p50', 'p95',
+                         'endpoint'], width=9)
+    for ep in sorted(recorded):
+        table.write({
+            'count': len(recorded[ep]),
+            'mismatch': errors[ep],
+            'rec p50': ms(percentile(recorded[ep], 50)),
+            'rec p95': ms(percentile(recorded[ep], 95)),
+            'p50': ms(percentile(replayed[ep], 50)),
+            'p95': ms(percentile(replayed[ep], 95)),
+            'endpoint': ep,
+        })
@@ -0,0 +1,222 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Fleet scenarios for the client simulator.
+
+A scenario is a JSON file describing cohorts of devices:
+
+    {
+        "seed": 1234,
+        "cohorts": [
+            {
+                "name": "rpi",
+                "count": 100,
+                "inventory": {"device_type": "raspberrypi3",
+                              "serial": "rpi-{index}"},
+                "inventory_update_freq": 60,
+                "delays": {"poll": {"dist": "uniform", "min": 2, "max": 8},
+                           "downloading": {"dist": "exponential", "mean": 20},
+                           "rebooting": {"dist": "normal", "mean": 30, "stddev": 5}},
+                "failure_probability": 0.05,
+                "failure_message": "update failed",
+                "reboot": {"reauthorize": true}
+            }
+        ]
+    }
+
+Inventory values may refer to {index} (device index in the fleet), {cohort}
+and {mac}. With "inventory_template", a built-in or file template of synthetic
+inventory (see synthetic module), the inventory is generated and "inventory"
+values override generated ones. A delay is either a number of seconds or a
+distribution, one of fixed (value), uniform (min, max), normal (mean, stddev)
+or exponential (mean). With `reboot.reauthorize`, devices lose their token
+when rebooting into an update and authorize again.
+"""
+import json
+
+from mender.cli import synthetic
+
+
+# distribution -> required parameters
+DISTRIBUTIONS = {
+    'fixed': ['value'],
+    'uniform': ['max'],
+    'normal': ['mean'],
+    'exponential': ['mean'],
+}
+
+# delays of device states
+STATES = ['poll', 'downloading', 'rebooting']
+
+# inventory of client devices, unless given otherwise
+DEFAULT_INVENTORY = ["device_type:fake-device", "image_type:fake-image"]
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+class Delay:
+    """Random delay in seconds, drawn from distribution given by `spec`"""
+    def __init__(self, spec):
+        if isinstance(spec, (int, float)):
+            spec = {'dist': 'fixed', 'value': spec}
+        if not isinstance(spec, dict):
+            raise ScenarioError('delay must be a number or an object, got {!r}'.format(spec))
+        self.dist = spec.get('dist', 'fixed')
+        if self.dist not in DISTRIBUTIONS:
+            raise ScenarioError('unknown distribution {}'.format(self.dist))
+        missing = [p for p in DISTRIBUTIONS[self.dist] if p not in spec]
+        if missing:
+            raise ScenarioError('{} distribution needs {}'.format(self.dist,
+                                                                  ', '.join(missing)))
+        for param, value in spec.items():
+            if param != 'dist' and not isinstance(value, (int, float)):
+                raise ScenarioError('{} of {} distribution must be a number'.format(
+                    param, self.dist))
+        self.spec = spec
+
+    def sample(self, rng):
+        s = self.spec
+        if self.dist == 'fixed':
+            val = s['value']
+        elif self.dist == 'uniform':
+            val = rng.uniform(s.get('min', 0), s['max'])
+        elif self.dist == 'normal':
+            val = rng.normalvariate(s['mean'], s.get('stddev', 0))
+        elif s['mean'] > 0:
+            val = rng.expovariate(1.0 / s['mean'])
+        else:
+            val = 0
+        return max(val, 0)
+
+
+class Cohort:
+    """A group of devices sharing behavior"""
+    def __init__(self, name='default', count=1, inventory=None,
+                 inventory_update_freq=60, delays=None,
+                 failure_probability=0, failure_message='update failed',
+                 reboot=None, updates=None, inventory_template=None):
+        for field, value in [('inventory', inventory), ('delays', delays),
+                             ('reboot', reboot)]:
+            if value is not None and not isinstance(value, dict):
+                raise ScenarioError('{} of cohort {} must be an object'.format(field, name))
+        self.name = name
+        self.count = count
+        self.inventory = inventory or {}
+        self.template = None
+        if inventory_template:
+            try:
+                self.template = synthetic.load_template(inventory_template)
+            except (IOError, synthetic.TemplateError) as err:
+                raise ScenarioError('cannot load inventory template: {}'.format(err))
+        self.inventory_update_freq = inventory_update_freq
+        self.delays = {
+            'poll': Delay({'dist': 'uniform', 'min': 2.5, 'max': 7.5}),
+            'downloading': Delay(0),
+            'rebooting': Delay(0),
+        }
+        for state, spec in (delays or {}).items():
+            if state not in STATES:
+                raise ScenarioError('unknown device state {}'.format(state))
+            self.delays[state] = Delay(spec)
+        self.failure_probability = failure_probability
+        self.failure_message = failure_message
+        self.reboot = reboot or {}
+        self.updates = updates
+
+    @classmethod
+    def from_opts(cls, opts):
+        """Cohort of devices behaving as given by client/fake-update options"""
+        wait = int(getattr(opts, 'wait', 0))
+        fail = getattr(opts, 'fail', '')
+        template = getattr(opts, 'inventory_template', None)
+        attrs = getattr(opts, 'inventory', None) or []
+        if template and attrs[:len(DEFAULT_INVENTORY)] == DEFAULT_INVENTORY:
+            # only attributes given explicitly override the template
+            attrs = attrs[len(DEFAULT_INVENTORY):]
+        inventory = {}
+        for attr in attrs:
+            n, v = attr.split(':', 1)
+            inventory[n.strip()] = v.strip()
+        return cls(count=getattr(opts, 'number', 1) or 1,
+                   inventory=inventory,
+                   inventory_template=template,
+                   inventory_update_freq=getattr(opts, 'inventory_update_freq', 60),
+                   delays={'downloading': {'dist': 'uniform', 'min': 0, 'max': wait},
+                           'rebooting': {'dist': 'uniform', 'min': 0, 'max': wait}},
+                   failure_probability=1 if fail else 0,
+                   failure_message=fail)
+
+    def delay(self, state, rng):
+        return self.delays[state].sample(rng)
+
+    def fails(self, rng):
+        return rng.random() < self.failure_probability
+
+    def reauthorize_on_reboot(self):
+        return bool(self.reboot.get('reauthorize'))
+
+    def inventory_attrs(self, index, mac, seed=None):
+        """Inventory of device `index` as list of {name, value}. It is computed
+        on each call, devices do not keep it."""
+        attrs = []
+        if self.template:
+            attrs = self.template.attributes(index, mac, seed)
+            if self.inventory:
+                attrs = [a for a in attrs if a['name'] not in self.inventory]
+        attrs.extend({'name': n,
+                      'value': str(v).format(index=index, cohort=self.name, mac=mac)}
+                     for n, v in self.inventory.items())
+        return attrs
+
+
+class Scenario:
+    def __init__(self, cohorts, seed=None):
+        self.cohorts = cohorts
+        self.seed = seed
+
+    def devices(self):
+        """Yield (index, cohort) of all devices in the fleet"""
+        index = 0
+        for cohort in self.cohorts:
+            for _ in range(cohort.count):
+                yield index, cohort
+                index += 1
+
+    def size(self):
+        return sum(c.count for c in self.cohorts)
+
+
+def load(path):
+    """Load scenario from JSON file at `path`, raises ScenarioError if it is
+    invalid"""
+    with open(path) as inf:
+        try:
+            spec = json.load(inf)
+        except ValueError as err:
+            raise ScenarioError('invalid scenario file {}: {}'.format(path, err))
+    try:
+        cohorts = [Cohort(**c) for c in spec['cohorts']]
+    except (KeyError, TypeError, AttributeError, ValueError) as err:
+        # ScenarioError included, a ValueError too
+        raise ScenarioError('invalid scenario {}: {}'.format(path, err))
+    return Scenario(cohorts, seed=spec.get('seed'))
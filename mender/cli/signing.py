@@ -0,0 +1,135 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def import_privkey(pem):
+    from mender.cli import device
+    return device.import_privkey(pem)
+
+
+def run_job(kind, args):
+    # runs in worker process
+    from mender.cli import device
+    if kind == 'keygen':
+        return device.gen_privkey(*args)
+    elif kind == 'sign':
+        data, pem = args
+        return device.sign(data, import_privkey(pem))
+    raise ValueError('unsupported job {}'.format(kind))
+
+
+def run_batch(jobs):
+    """Run a batch of (kind, args) jobs in a worker process, returns a list of
+    (exception, result) tuples"""
+    results = []
+    for kind, args in jobs:
+        try:
+            results.append((None, run_job(kind, args)))
+        except Exception as err:
+            results.append((err, None))
+    return results
+
+
+class SigningService:
+    """Offload device key generation and signing to a pool of worker processes,
+    so that crypto is not serialized on the GIL together with the network side
+    of the simulator. Jobs submitted from many threads are collected into
+    batches of up to `batch_size` to amortize the cost of passing them to a
+    worker."""
+    def __init__(self, workers=None, batch_size=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        # workers are spawned while the simulator threads are already running,
+        # forking those is not safe
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self.jobs = queue.Queue()
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+        logging.info('signing service started with %d workers', self.workers)
+
+    def dispatch(self):
+        while True:
+            batch = [self.jobs.get()]
+            if batch[0] is None:
+                return
+            # grab whatever else is already waiting
+            while len(batch) < self.batch_size:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self.jobs.put(None)
+                    break
+                batch.append(job)
+
+            futures = [fut for _, _, fut in batch]
+            try:
+                pending = self.executor.submit(run_batch, [(kind, args)
+                                                           for kind, args, _ in batch])
+            except RuntimeError as err:
+                # executor is shut down
+                for fut in futures:
+                    fut.set_exception(err)
+                continue
+            pending.add_done_callback(lambda pending, futures=futures:
+                                      self.complete(pending, futures))
+
+    @staticmethod
+    def complete(pending, futures):
+        err = pending.exception()
+        if err:
+            for fut in futures:
+                fut.set_exception(err)
+            return
+        for fut, (err, result) in zip(futures, pending.result()):
+            if err:
+                fut.set_exception(err)
+            else:
+                fut.set_result(result)
+
+    def submit(self, kind, *args):
+        fut = Future()
+        self.jobs.put((kind, args, fut))
+        return fut
+
+    def gen_privkey(self, *args):
+        """Generate a private key, see device.gen_privkey()"""
+        return self.submit('keygen', *args).result()
+
+    def sign(self, data, pem):
+        """Sign `data` with private key `pem`, see device.sign()"""
+        return self.submit('sign', data, pem).result()
+
+    def shutdown(self):
+        self.jobs.put(None)
+        self.dispatcher.join()
+        self.executor.shutdown()
@@ -0,0 +1,249 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Discrete-event simulation of a device fleet on a virtual clock.
+
+Devices run the same state machine as client threads (see
+client.device_lifecycle()), but their delays advance a virtual clock instead of
+sleeping, and requests go to FakeBackend, an in-process model of the backend.
+Hours of fleet behavior take seconds to simulate.
+"""
+import collections
+import heapq
+import itertools
+import logging
+import time
+
+from mender.cli import client
+from mender.cli.devstate import DeviceState
+from mender.cli.utils import CachedToken
+from mender.client import ClientNotAuthorizedError
+
+
+class Scheduler:
+    """Runs processes on a virtual clock. A process is a generator yielding
+    delays in seconds, it is resumed once the clock advanced by that much."""
+    def __init__(self):
+        self.now = 0.0
+        self.queue = []
+        self.seq = itertools.count()
+        self.steps = 0
+
+    def spawn(self, proc, delay=0):
+        heapq.heappush(self.queue, (self.now + delay, next(self.seq), proc))
+
+    def run(self, until=None):
+        """Run processes until none is left or the clock reaches `until`"""
+        queue = self.queue
+        while queue:
+            at, _, proc = queue[0]
+            if until is not None and at > until:
+                break
+            heapq.heappop(queue)
+            self.now = at
+            self.steps += 1
+            try:
+                delay = next(proc)
+            except StopIteration:
+                continue
+            heapq.heappush(queue, (at + delay, next(self.seq), proc))
+        if until is not None and queue:
+            self.now = max(self.now, until)
+
+
+def until_done(proc, done):
+    """Run `proc` until `done` is set"""
+    for delay in proc:
+        yield delay
+        if done:
+            return
+
+
+class FakeDevice:
+    __slots__ = ['first_seen', 'token', 'deployment']
+
+    def __init__(self):
+        self.first_seen = None
+        self.token = None
+        # last deployment finished
+        self.deployment = -1
+
+
+class FakeDeployment:
+    def __init__(self, backend, opts, number):
+        self.backend = backend
+        self.opts = opts
+        self.number = number
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def status(self, status):
+        dev = self.backend.check_token(self.opts)
+        self.backend.stats['status_' + status] += 1
+        if status in ('success', 'failure'):
+            dev.deployment = self.number
+            self.backend.stats['updates'] += 1
+
+    def download(self):
+        self.backend.stats['downloads'] += 1
+
+    def log(self, message):
+        self.backend.check_token(self.opts)
+        self.backend.stats['logs'] += 1
+
+
+class FakeBackend:
+    """In-process backend for devices simulated on `scheduler` clock. Devices
+    are accepted `admission_delay` seconds after their first authorization
+    request and get tokens valid for `token_lifetime` seconds. A new deployment
+    for all devices starts every `deployment_interval` seconds. Requests are
+    counted in `stats`."""
+    def __init__(self, scheduler, token_lifetime=7 * 24 * 3600,
+                 deployment_interval=3600, admission_delay=0, jitter=0.1):
+        self.scheduler = scheduler
+        self.token_lifetime = token_lifetime
+        self.deployment_interval = deployment_interval
+        self.admission_delay = admission_delay
+        self.jitter = jitter
+        self.devices = {}
+        self.stats = collections.Counter()
+
+    def device(self, opts):
+        try:
+            return self.devices[opts.mac_address]
+        except KeyError:
+            dev = self.devices[opts.mac_address] = FakeDevice()
+            return dev
+
+    def check_token(self, opts):
+        dev = self.device(opts)
+        if dev.token is None or dev.token.exp <= self.scheduler.now:
+            self.stats['unauthorized'] += 1
+            raise ClientNotAuthorizedError('token expired')
+        return dev
+
+    def ensure_key(self, opts):
+        pass
+
+    def authorize(self, opts):
+        now = self.scheduler.now
+        dev = self.device(opts)
+        self.stats['auth_requests'] += 1
+        if dev.first_seen is None:
+            dev.first_seen = now
+        if now - dev.first_seen < self.admission_delay:
+            return False
+        self.stats['auths'] += 1
+        exp = now + self.token_lifetime
+        # refresh point drawn as TokenCache does
+        refresh_at = exp - self.token_lifetime * opts.rng.uniform(self.jitter, 2 * self.jitter)
+        dev.token = CachedToken(None, exp, refresh_at)
+        return True
+
+    def authorized(self, opts):
+        return self.device(opts).token is not None
+
+    def invalidate(self, opts):
+        self.device(opts).token = None
+
+    def token_expiring(self, opts):
+        token = self.device(opts).token
+        return token is not None and token.expiring(self.scheduler.now)
+
+    def next_update(self, opts):
+        dev = self.check_token(opts)
+        self.stats['update_checks'] += 1
+        number = int(self.scheduler.now // self.deployment_interval)
+        if number <= dev.deployment:
+            return None
+        return {'id': 'deployment-{}'.format(number), 'number': number,
+                'image': {'uri': 'fake://{}'.format(number)}}
+
+    def deployment(self, opts, update):
+        return FakeDeployment(self, opts, update['number'])
+
+    def inventory(self, opts, attrs):
+        self.check_token(opts)
+        self.stats['inventory'] += 1
+        self.stats['inventory_attrs'] += len(attrs)
+
+
+def simulate(scen, opts, backend=None, duration=24 * 3600, fleet=None):
+    """Simulate fleet of scenario `scen` for `duration` seconds of virtual
+    time, or until `fleet` (see client.Fleet) is stopped and devices drained.
+    Device options are derived from `opts`. Returns (scheduler, backend)."""
+    scheduler = Scheduler()
+    if fleet is None:
+        fleet = client.Fleet()
+    if backend is None:
+        backend = FakeBackend(scheduler)
+    else:
+        backend.scheduler = scheduler
+    config = client.fleet_config(opts, scen.seed)
+    for index, cohort in scen.devices():
+        dev_opts = DeviceState(config, index, cohort)
+        done = []
+
+        def lifecycle(dev_opts=dev_opts, done=done):
+            yield from client.device_lifecycle(dev_opts, backend, fleet)
+            done.append(True)
+
+        scheduler.spawn(lifecycle())
+        scheduler.spawn(until_done(client.inventory_lifecycle(dev_opts, backend, fleet), done))
+    scheduler.run(until=duration)
+    return scheduler, backend
+
+
+def do_virtual(opts, scen, fleet):
+    if not opts.debug:
+        # device chatter would dominate the run time
+        logging.getLogger().setLevel(logging.WARNING)
+    start = time.perf_counter()
+    scheduler, backend = simulate(
+        scen, opts,
+        backend=FakeBackend(None, token_lifetime=opts.token_lifetime,
+                            deployment_interval=opts.deployment_interval,
+                            admission_delay=opts.admission_delay),
+        duration=opts.duration or 24 * 3600, fleet=fleet)
+    elapsed = time.perf_counter() - start
+
+    seconds = scheduler.now
+    stats = backend.stats
+    summary = {
+        'devices': scen.size(),
+        'seed': scen.seed,
+        'simulated_seconds': seconds,
+        'wall_seconds': round(elapsed, 3),
+        'events': scheduler.steps,
+        'updates': fleet.updates,
+        'updates_per_min': client.rate(fleet.updates, seconds),
+        'failed_inventory_reports': fleet.inventory_failures,
+        'auths': stats['auths'],
+        'auths_per_min': client.rate(stats['auths'], seconds),
+        'requests': dict(sorted(stats.items())),
+        'requests_per_hour': {k: client.rate(v, seconds, per=3600)
+                              for k, v in sorted(stats.items())},
+    }
+    client.print_summary(summary)
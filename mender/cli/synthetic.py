@@ -0,0 +1,249 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gregorio Di Stefano
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Synthetic device inventory.
+
+A template maps attribute names to value specs:
+
+    "foo"                                 constant, may refer to {index} and {mac}
+    {"format": "SN{index:08d}"}           per device value, same fields
+    {"choice": ["a", "b"], "weights": [3, 1]}
+                                          one of values, weights are optional
+    {"int": [0, 100]}                     integer in range, inclusive
+    {"hex": 16}                           hex string of given length
+    {"ipv4": "10.0.0.0/8"}                address in network, unique per device
+
+Values are computed when needed from device index and seed, devices keep no
+copy of their inventory. Templates are shared, choice values are interned.
+"""
+import ipaddress
+import json
+import sys
+
+
+MASK64 = (1 << 64) - 1
+
+
+def mix(x):
+    """splitmix64 finalizer, a cheap well distributed hash of an integer"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class Attribute:
+    __slots__ = ['name', 'kind', 'arg', 'cumulative']
+
+    def __init__(self, name, spec):
+        self.name = sys.intern(name)
+        self.cumulative = None
+        try:
+            self._parse(spec)
+            # fail on unknown fields now rather than when generating values
+            if self.kind == 'format':
+                self.arg.format(index=0, mac='')
+        except TemplateError:
+            raise
+        except (TypeError, ValueError, LookupError, AttributeError) as err:
+            raise TemplateError('invalid spec of {}: {}: {}'.format(name, spec, err))
+
+    def _parse(self, spec):
+        name = self.name
+        if not isinstance(spec, dict):
+            self.kind = 'format' if isinstance(spec, str) and '{' in spec else 'const'
+            self.arg = sys.intern(spec) if isinstance(spec, str) else spec
+            return
+        if len(spec) != 1 and not ('choice' in spec and 'weights' in spec):
+            raise TemplateError('invalid spec of {}: {}'.format(name, spec))
+        if 'choice' in spec:
+            if not isinstance(spec['choice'], list):
+                raise TemplateError('invalid choice of {}'.format(name))
+            self.kind = 'choice'
+            self.arg = [sys.intern(v) if isinstance(v, str) else v
+                        for v in spec['choice']]
+            weights = spec.get('weights') or [1] * len(self.arg)
+            if len(weights) != len(self.arg) or not self.arg:
+                raise TemplateError('invalid choice of {}'.format(name))
+            total = float(sum(weights))
+            acc = 0
+            self.cumulative = []
+            for w in weights:
+                acc += w
+                self.cumulative.append(acc / total)
+        elif 'format' in spec:
+            if not isinstance(spec['format'], str):
+                raise TemplateError('invalid format of {}'.format(name))
+            self.kind, self.arg = 'format', spec['format']
+        elif 'int' in spec:
+            lo, hi = spec['int']
+            if not isinstance(lo, int) or not isinstance(hi, int) or lo > hi:
+                raise TemplateError('invalid int range of {}'.format(name))
+            self.kind, self.arg = 'int', (lo, hi)
+        elif 'hex' in spec:
+            self.kind, self.arg = 'hex', int(spec['hex'])
+            if self.arg < 1:
+                raise TemplateError('invalid hex length of {}'.format(name))
+        elif 'ipv4' in spec:
+            net = ipaddress.IPv4Network(spec['ipv4'])
+            # first host address and number of host addresses
+            self.kind = 'ipv4'
+            self.arg = (int(net.network_address) + 1, max(net.num_addresses - 2, 1))
+        else:
+            raise TemplateError('invalid spec of {}: {}'.format(name, spec))
+
+    def value(self, index, mac, h):
+        """Value for device `index`, `h` is a 64 bit hash specific to the
+        device and attribute"""
+        kind = self.kind
+        if kind == 'const':
+            return self.arg
+        if kind == 'choice':
+            u = h / 2.0 ** 64
+            for i, c in enumerate(self.cumulative):
+                if u < c:
+                    return self.arg[i]
+            return self.arg[-1]
+        if kind == 'format':
+            return self.arg.format(index=index, mac=mac)
+        if kind == 'int':
+            lo, hi = self.arg
+            return lo + h % (hi - lo + 1)
+        if kind == 'hex':
+            return ''.join('{:016x}'.format(mix(h + i))
+                           for i in range(0, self.arg, 16))[:self.arg]
+        # ipv4
+        first, count = self.arg
+        ip = first + index % count
+        return '%d.%d.%d.%d' % (ip >> 24, (ip >> 16) & 255, (ip >> 8) & 255, ip & 255)
+
+
+class InventoryTemplate:
+    """Generator of device inventories from template `spec`, see module
+    docstring"""
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise TemplateError('template must be a JSON object')
+        self.attrs = [Attribute(name, s) for name, s in spec.items()]
+
+    def attributes(self, index, mac=None, seed=None):
+        """Inventory of device `index` as a list of {name, value}"""
+        base = mix((seed or 0) ^ mix(index))
+        mac = mac or ''
+        return [{'name': a.name, 'value': a.value(index, mac, mix(base + i))}
+                for i, a in enumerate(self.attrs)]
+
+
+KERNELS = ['4.14.98', '4.19.118', '5.4.72', '5.10.35', '5.15.61', '6.1.21']
+
+# built-in templates
+TEMPLATES = {
+    'minimal': {
+        'device_type': 'fake-device',
+        'image_type': 'fake-image',
+    },
+    'realistic': {
+        'device_type': {'choice': ['raspberrypi3', 'raspberrypi4', 'beaglebone',
+                                   'qemux86-64', 'imx8mm-evk', 'jetson-nano',
+                                   'intel-nuc', 'colibri-imx7'],
+                        'weights': [30, 25, 10, 5, 10, 8, 7, 5]},
+        'artifact_name': {'choice': ['release-{}'.format(v) for v in range(1, 13)],
+                          'weights': [1, 1, 1, 2, 2, 3, 4, 6, 10, 20, 30, 20]},
+        'rootfs-image.version': {'choice': ['3.{}.{}'.format(a, b)
+                                            for a in range(4) for b in range(5)]},
+        'mender_client_version': {'choice': ['2.6.1', '3.0.0', '3.1.0', '3.2.1',
+                                             '3.3.0', '3.4.0', '3.5.1'],
+                                  'weights': [2, 3, 5, 10, 20, 30, 30]},
+        'mender_bootloader_integration': {'choice': ['uboot', 'grub', 'unknown'],
+                                          'weights': [60, 35, 5]},
+        'os': {'choice': ['Poky (Yocto Project Reference Distro) 3.1',
+                          'Poky (Yocto Project Reference Distro) 4.0',
+                          'Debian GNU/Linux 11 (bullseye)',
+                          'Ubuntu 20.04.6 LTS', 'Ubuntu 22.04.3 LTS'],
+               'weights': [20, 30, 25, 10, 15]},
+        'kernel': {'choice': ['Linux version {}'.format(k) for k in KERNELS]},
+        'cpu_model': {'choice': ['ARMv7 Processor rev 4 (v7l)',
+                                 'Cortex-A72', 'Cortex-A53',
+                                 'Intel(R) Celeron(R) J4125 CPU @ 2.00GHz',
+                                 'Intel(R) Core(TM) i5-8259U CPU @ 2.30GHz'],
+                      'weights': [35, 30, 20, 10, 5]},
+        'cpu_cores': {'choice': [1, 2, 4, 8], 'weights': [5, 15, 70, 10]},
+        'mem_total_kB': {'choice': [505856, 1000184, 2021248, 3930176, 8039420],
+                         'weights': [10, 30, 25, 25, 10]},
+        'storage_total_kB': {'choice': [7634944, 15269888, 30539776, 61079552]},
+        'hostname': {'format': 'device-{index:06d}'},
+        'serial_number': {'format': 'SN{index:010d}'},
+        'hardware_revision': {'choice': ['rev1', 'rev2', 'rev3', 'rev3b']},
+        'mac_eth0': '{mac}',
+        'ipv4_eth0': {'ipv4': '10.0.0.0/8'},
+        'ipv4_wlan0': {'ipv4': '172.16.0.0/12'},
+        'network_interfaces': {'choice': ['eth0', 'eth0,wlan0', 'wlan0', 'eth0,eth1,wlan0'],
+                               'weights': [40, 40, 15, 5]},
+        'wifi_ssid': {'choice': ['factory-floor', 'warehouse', 'office',
+                                 'lab', 'field']},
+        'cellular_operator': {'choice': ['none', 'Vodafone', 'T-Mobile', 'Orange',
+                                         'Verizon', 'AT&T'],
+                              'weights': [60, 8, 8, 8, 8, 8]},
+        'imei': {'format': '35{index:013d}'},
+        'uptime_s': {'int': [60, 30 * 24 * 3600]},
+        'timezone': {'choice': ['UTC', 'Europe/Berlin', 'Europe/Warsaw',
+                                'America/New_York', 'America/Los_Angeles',
+                                'Asia/Tokyo', 'Asia/Kolkata'],
+                     'weights': [30, 15, 10, 15, 10, 10, 10]},
+        'region': {'choice': ['eu-west', 'eu-central', 'us-east', 'us-west',
+                              'ap-south', 'ap-northeast']},
+        'site_id': {'int': [1, 2500]},
+        'customer_id': {'choice': ['cust-{:04d}'.format(i) for i in range(200)]},
+        'geo_lat': {'int': [-60, 70]},
+        'geo_lon': {'int': [-180, 180]},
+        'bootloader_version': {'choice': ['U-Boot 2019.07', 'U-Boot 2020.01',
+                                          'U-Boot 2022.04', 'GRUB 2.04', 'GRUB 2.06']},
+        'secure_boot': {'choice': ['enabled', 'disabled'], 'weights': [30, 70]},
+        'app_bundle_hash': {'hex': 40},
+        'device_group_hint': {'choice': ['production', 'staging', 'qa', 'dev'],
+                              'weights': [80, 10, 5, 5]},
+    },
+}
+
+# loaded templates, shared by all devices using them
+_templates = {}
+
+
+def load_template(name):
+    """Return shared template, either a built-in one or loaded from JSON file
+    at path `name`. Raises TemplateError or IOError."""
+    tmpl = _templates.get(name)
+    if tmpl is not None:
+        return tmpl
+    if name in TEMPLATES:
+        spec = TEMPLATES[name]
+    else:
+        with open(name) as inf:
+            try:
+                spec = json.load(inf)
+            except ValueError as err:
+                raise TemplateError('invalid template {}: {}'.format(name, err))
+    tmpl = _templates[name] = InventoryTemplate(spec)
+    return tmpl
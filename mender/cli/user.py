@@ -22,7 +22,7 @@
 import logging
 
 from mender.cli.utils import api_from_opts, run_command, dump_token, \
-    load_file, save_file, do_simple_get
+    load_file, save_file, do_simple_get, user_tokens
 from mender.client import user_url
 
 
@@ -74,9 +74,9 @@ def do_user_login(opts):
         rsp = api.post(url)
 
         if rsp.status_code == 200:
-            logging.info('request successful')
-            logging.info('token: %s', rsp.text)
+            logging.info('request successful, token saved to %s', opts.user_token)
             save_file(opts.user_token, rsp.text)
+            user_tokens.put(opts.user_token, rsp.text)
         else:
             logging.warning('request failed: %s %s', rsp, rsp.text)
 
@@ -91,9 +91,9 @@ def do_user_login_initial(opts):
         rsp = api.post(url)
 
         if rsp.status_code == 200:
-            logging.info('initial login successful')
-            logging.info('token: %s', rsp.text)
+            logging.info('initial login successful, token saved to %s', opts.user_token)
             save_file(opts.user_token, rsp.text)
+            user_tokens.put(opts.user_token, rsp.text)
         else:
             logging.warning('request failed: %s %s', rsp, rsp.text)
 
@@ -134,7 +134,7 @@ def dump_user(data):
 
 def list_users(opts):
     logging.info('list users')
-    with api_from_opts(opts) as api:
+    with api_from_opts(opts, cache=True) as api:
         do_simple_get(api, user_url(opts.service, '/users'),
                       printer=lambda rsp: [dump_user(user)
                                            for user in rsp.json()])
@@ -19,14 +19,28 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import codecs
 import logging
 import json
 import os.path
-from base64 import b64decode
+import random
+import sys
+import threading
+import time
+from base64 import urlsafe_b64decode
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 import requests
+from requests.adapters import DEFAULT_POOLSIZE
 
+from mender.cli import profiling
+from mender.cli.jsonstream import JSONReformatter
 from mender.client import ApiClient, JWTAuth, ClientNotAuthorizedError
+from mender.client.retry import RetryPolicy
+from mender.client.limiter import limiter_for
+from mender.client.timing import TimingAdapter
+from mender.client.cache import ResponseCache
 
 
 def run_command(command, cmds, opts):
@@ -57,8 +71,46 @@ class CommandNotSupportedError(Exception):
         return 'command {} is not supported'.format(self.command)
 
 
-def api_from_opts(opts):
-    api = ApiClient()
+class SharedAdapter(TimingAdapter):
+    """Adapter shared by many sessions, so that they use one connection pool.
+    Closing a session leaves the adapter open, call shutdown() once done."""
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+# adapter used by all sessions, if set
+shared_adapter = None
+
+
+def api_from_opts(opts, pool_size=None, cache=False):
+    """Create API client session based on `opts`. Pass `pool_size` when the
+    session is to be shared by that many threads, so that each gets its own
+    connection from the pool. Pass `cache` for read-only commands whose GET
+    responses can be cached, unless disabled by --no-cache."""
+    api = ApiClient(retry=RetryPolicy(retries=opts.retries))
+    if cache and not opts.no_cache:
+        try:
+            api.cache = ResponseCache(opts.cache_dir, ttl=opts.cache_ttl,
+                                      max_size=opts.cache_size * 1024 * 1024)
+        except OSError as err:
+            logging.warning('not caching responses, cannot use %s: %s',
+                            opts.cache_dir, err)
+    if opts.adaptive_concurrency:
+        api.limiter = limiter_for(urlsplit(opts.service).netloc,
+                                  maximum=opts.adaptive_concurrency,
+                                  latency_target=opts.latency_target)
+    if shared_adapter:
+        api.mount('https://', shared_adapter)
+        api.mount('http://', shared_adapter)
+    elif pool_size or opts.http_timing:
+        pool_size = pool_size or DEFAULT_POOLSIZE
+        adapter = TimingAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                timing=opts.http_timing)
+        api.mount('https://', adapter)
+        api.mount('http://', adapter)
     if opts.no_verify:
         api.verify = False
 
@@ -67,22 +119,39 @@ def api_from_opts(opts):
 
     if opts.cacert:
         api.verify = opts.cacert
-    if opts.user_token and os.path.exists(opts.user_token):
-        logging.info('loading user token from %s', opts.user_token)
-        token = load_file(opts.user_token)
-        api.auth = JWTAuth(token)
+    if opts.user_token:
+        cached = user_tokens.get(opts.user_token)
+        if cached is not None:
+            logging.debug('using user token from %s', opts.user_token)
+            api.auth = JWTAuth(cached.token)
     return api
 
+# output format of jsonprinter, one of jsonstream.JSON_FORMATS
+json_format = 'pretty'
+
+
 def jsonprinter(rsp):
-    """Printer for JSON type responses"""
-    import json
+    """Printer for JSON type responses. The body is reformatted as it is read, so
+    large responses can be printed, preferably if the request was made with
+    stream=True."""
     if not isinstance(rsp, requests.Response):
         raise TypeError("expected requests.Response")
+    decoder = codecs.getincrementaldecoder(rsp.encoding or 'utf-8')(errors='replace')
+    fmt = JSONReformatter(sys.stdout, mode=json_format)
     try:
-        print(json.dumps(rsp.json(), indent=4))
+        for chunk in rsp.iter_content(chunk_size=64 * 1024):
+            fmt.feed(decoder.decode(chunk))
+        fmt.feed(decoder.decode(b'', final=True))
+        fmt.finish()
     except ValueError:
         logging.error("Failed to pprint response, content was not JSON")
-        logging.error("response text: %s", rsp.text)
+        if not rsp.raw or rsp.raw.closed:
+            logging.error("response text: %s", rsp.text)
+    finally:
+        sys.stdout.flush()
+
+# responses printed by jsonprinter need not be loaded into memory first
+jsonprinter.streaming = True
 
 
 def simpleprinter(rsp):
@@ -92,6 +161,39 @@ def simpleprinter(rsp):
     print(rsp.text)
 
 
+class NDJSONWriter:
+    """Streaming writer emitting one JSON document per line"""
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def write(self, obj):
+        self.out.write(json.dumps(obj) + '\n')
+        self.out.flush()
+
+
+class TableWriter:
+    """Streaming writer of table rows. Since rows are written as they come,
+    column widths are fixed upfront, longer values will overflow."""
+    def __init__(self, columns, width=20, out=None):
+        self.columns = columns
+        self.width = width
+        self.out = out or sys.stdout
+        self.header = False
+
+    def _line(self, values):
+        return ' '.join('{:{}}'.format(str(v), self.width)
+                        for v in values).rstrip() + '\n'
+
+    def write(self, row):
+        """Write `row`, a map of column name to value"""
+        if not self.header:
+            self.out.write(self._line(self.columns))
+            self.header = True
+        self.out.write(self._line(row.get(col, '<undefined>')
+                                  for col in self.columns))
+        self.out.flush()
+
+
 def errorprinter(rsp):
     """Helper printer for error responses"""
     try:
@@ -113,14 +215,15 @@ def do_simple_delete(api, url, printer=jsonprinter, success=204, **kwargs):
                       printer=printer, success=success, **kwargs)
 
 def do_request(api, url, method='GET', printer=jsonprinter, success=[200, 204], **kwargs):
-    rsp = api.request(method, url, **kwargs)
+    if method == 'GET' and getattr(printer, 'streaming', False):
+        kwargs.setdefault('stream', True)
+    with profiling.span('do_request', 'network', method=method, url=url):
+        rsp = api.request(method, url, **kwargs)
     logging.debug(rsp)
     if (isinstance(success, list) and rsp.status_code in success) \
        or rsp.status_code == success:
         if rsp.status_code != 204 and printer:
-            if len(rsp.content) > 1024 * 1024:
-                logging.info("response too big to print")
-            else:
+            with profiling.span('print'):
                 printer(rsp)
     else:
         if rsp.status_code in [401, 403]:
@@ -129,25 +232,170 @@ def do_request(api, url, method='GET', printer=jsonprinter, success=[200, 204],
     return rsp
 
 
+def iter_pages(api, url, per_page=500, params=None):
+    """Generator yielding items of a paginated collection at `url`, fetching
+    one page of `per_page` items at a time. Follows `Link: rel=next` headers if
+    the service provides them, otherwise stops at the first short page. Stops
+    as well once a page repeats the previous one, as with a service ignoring
+    paging parameters."""
+    params = dict(params or {}, per_page=per_page, page=1)
+    previous = None
+    while url:
+        rsp = do_request(api, url, printer=None, success=200, params=params)
+        if rsp.status_code != 200:
+            return
+        items = rsp.json()
+        if items == previous:
+            logging.warning('%s returned the same page again, stopping', url)
+            return
+        previous = items
+        yield from items
+
+        if 'next' in rsp.links:
+            # next link carries all the query parameters already, and may be
+            # relative to the page
+            url, params = urljoin(rsp.url, rsp.links['next']['url']), None
+        elif params is None or 'Link' in rsp.headers or len(items) != per_page:
+            # either the last page, or the service does not paginate
+            return
+        else:
+            params['page'] += 1
+
+
+def run_parallel(func, items, jobs=8):
+    """Call `func(item)` for each of `items` using at most `jobs` threads.
+    Yields (item, result, exception) tuples in completion order. Items are
+    consumed lazily, so `items` may be a generator such as `iter_pages()`."""
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {}
+        items = iter(items)
+        exhausted = False
+        while pending or not exhausted:
+            # keep the backlog bounded, no point queuing everything upfront
+            while not exhausted and len(pending) < jobs * 2:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = item
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item = pending.pop(fut)
+                exc = fut.exception()
+                yield item, None if exc else fut.result(), exc
+
+
 def pad_b64(b64s):
     """Pad Base64 encoded string so that its length is a multiple of 4 bytes"""
-    pad = len(b64s) % 4
-    if pad != 0:
-        return b64s + '=' * pad
-    return b64s
+    return b64s + '=' * (-len(b64s) % 4)
 
 
-def dump_token(tok):
-    split = tok.split('.')
-    for name, val in zip(['type', 'claims'], split[0:2]):
+def decode_token(tok):
+    """Decode JWT token `tok`, returns a tuple (header, claims). The signature
+    is not verified."""
+    decoded = []
+    for val in tok.strip().split('.')[0:2]:
         pad = pad_b64(val)
         logging.debug('padded: %s', pad)
-        raw = b64decode(pad)
-        # logging.info('%s: %s', n, raw)
-        data = json.loads(str(raw, 'utf-8'))
+        raw = urlsafe_b64decode(pad)
+        decoded.append(json.loads(str(raw, 'utf-8')))
+    return tuple(decoded)
+
+
+def dump_token(tok):
+    for name, data in zip(['type', 'claims'], decode_token(tok)):
         print('{}\n\t'.format(name), data)
 
-    print('signature:\n\t', split[2])
+    print('signature:\n\t', tok.strip().split('.')[2])
+
+
+class CachedToken:
+    """Token with its expiration time, see TokenCache"""
+    __slots__ = ['token', 'exp', 'refresh_at']
+
+    def __init__(self, token, exp=None, refresh_at=None):
+        self.token = token
+        self.exp = exp
+        self.refresh_at = refresh_at
+
+    def expiring(self, now=None):
+        """Return True if the token should be refreshed"""
+        if self.refresh_at is None:
+            return False
+        return (time.time() if now is None else now) >= self.refresh_at
+
+
+class TokenCache:
+    """In-memory cache of tokens stored in files, keyed by file path. Tokens are
+    decoded once, with refresh time scheduled at a random point between
+    `jitter` and 2 * `jitter` fraction of their lifetime before expiry, so that
+    a fleet of tokens issued at once does not expire all at once."""
+    def __init__(self, jitter=0.1):
+        self.jitter = jitter
+        self._tokens = {}
+        # path -> stamp of the file when its token was invalidated
+        self._invalid = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _make(self, token):
+        try:
+            _, claims = decode_token(token)
+        except (ValueError, IndexError) as err:
+            logging.debug('cannot decode token: %s', err)
+            return CachedToken(token)
+
+        exp = claims.get('exp')
+        if exp is None:
+            return CachedToken(token)
+        now = time.time()
+        lifetime = max(exp - claims.get('iat', now), 0)
+        refresh_at = exp - lifetime * random.uniform(self.jitter, 2 * self.jitter)
+        return CachedToken(token, exp, refresh_at)
+
+    def get(self, path):
+        """Get token stored at `path`, loading the file on first use. Returns
+        None if there is no token, or it was invalidated and the file has not
+        changed since."""
+        with self._lock:
+            cached = self._tokens.get(path)
+            invalid = self._invalid.get(path)
+        if cached is not None:
+            return cached
+        stamp = self._stamp(path)
+        if stamp is None or stamp == invalid:
+            return None
+        return self.put(path, load_file(path))
+
+    def put(self, path, token):
+        """Cache `token` for `path`, the caller is responsible for saving it"""
+        cached = self._make(token)
+        with self._lock:
+            self._tokens[path] = cached
+            self._invalid.pop(path, None)
+        return cached
+
+    def invalidate(self, path):
+        """Drop token of `path`, the file is not loaded again until it changes"""
+        stamp = self._stamp(path)
+        with self._lock:
+            self._tokens.pop(path, None)
+            self._invalid[path] = stamp
+
+
+# user tokens, keyed by token path
+user_tokens = TokenCache()
 
 
 def load_file(path):
@@ -23,7 +23,6 @@ import logging
 
 import requests
 import requests.auth
-from requests import Session as ApiClient
 
 
 API_URL = '/api/management/v1/'
@@ -102,3 +101,35 @@ class JWTAuth(requests.auth.AuthBase):
     def __call__(self, r):
         r.headers['Authorization'] = 'Bearer {}'.format(self.token)
         return r
+
+
+class ApiClient(requests.Session):
+    """API client session. Requests follow `retry` policy, if one is set, and
+    each attempt waits for a slot of `limiter` (see AdaptiveLimiter), if one is
+    set. GET requests go through `cache` (see ResponseCache), if one is set."""
+    def __init__(self, retry=None, limiter=None, cache=None):
+        super().__init__()
+        self.retry = retry
+        self.limiter = limiter
+        self.cache = cache
+
+    def send_limited(self, method, url, **kwargs):
+        if self.limiter is None:
+            return super().request(method, url, **kwargs)
+        with self.limiter.slot() as done:
+            rsp = super().request(method, url, **kwargs)
+            done(rsp.status_code)
+            return rsp
+
+    def send_retried(self, method, url, idempotent=None, **kwargs):
+        if self.retry is None:
+            return self.send_limited(method, url, **kwargs)
+        return self.retry.call(self.send_limited, method, url,
+                               idempotent=idempotent, **kwargs)
+
+    def request(self, method, url, *args, idempotent=None, **kwargs):
+        if args:
+            return super().request(method, url, *args, **kwargs)
+        if self.cache is not None and method.upper() == 'GET':
+            return self.cache.request(self.send_retried, url, auth=self.auth, **kwargs)
+        return self.send_retried(method, url, idempotent=idempotent, **kwargs)
@@ -0,0 +1,163 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import requests
+from requests.models import PreparedRequest
+from requests.structures import CaseInsensitiveDict
+
+
+# response headers kept in the cache
+CACHED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Link', 'X-Total-Count']
+
+
+class ResponseCache:
+    """On-disk cache of GET responses in directory `path`, keyed by URL and
+    identity of the token the request is made with. Entries with ETag or
+    Last-Modified are revalidated with a conditional request every time, other
+    entries are used without asking the server for `ttl` seconds. Least
+    recently used entries are removed once the bodies take more than
+    `max_size` bytes. Raises OSError if directory `path` cannot be created."""
+    def __init__(self, path, ttl=60, max_size=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, url, auth):
+        ident = getattr(auth, 'token', None) or ''
+        return hashlib.sha256('{}\0{}'.format(url, ident).encode()).hexdigest()
+
+    def entry_path(self, key, ext):
+        return os.path.join(self.path, key + ext)
+
+    def load(self, key):
+        try:
+            with open(self.entry_path(key, '.json')) as inf:
+                meta = json.load(inf)
+            with open(self.entry_path(key, '.body'), 'rb') as inf:
+                body = inf.read()
+        except (IOError, ValueError):
+            return None, None
+        return meta, body
+
+    def write_atomic(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outf:
+            outf.write(data)
+        os.replace(tmp, path)
+
+    def store(self, key, rsp):
+        if len(rsp.content) > self.max_size:
+            return
+        meta = {
+            'url': rsp.url,
+            'status': rsp.status_code,
+            'encoding': rsp.encoding,
+            'headers': {h: rsp.headers[h] for h in CACHED_HEADERS if h in rsp.headers},
+            'stored': time.time(),
+        }
+        # body first, an entry with metadata but no body is not used
+        self.write_atomic(self.entry_path(key, '.body'), rsp.content)
+        self.write_atomic(self.entry_path(key, '.json'), json.dumps(meta).encode())
+        self.evict()
+
+    def evict(self):
+        bodies = []
+        for name in os.listdir(self.path):
+            if name.endswith('.body'):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                bodies.append((st.st_mtime, st.st_size, name[:-len('.body')]))
+        total = sum(size for _, size, _ in bodies)
+        # oldest use first
+        for _, size, key in sorted(bodies):
+            if total <= self.max_size:
+                break
+            for ext in ['.json', '.body']:
+                try:
+                    os.remove(self.entry_path(key, ext))
+                except OSError:
+                    pass
+            total -= size
+
+    def touch(self, key):
+        # mtime of the body tracks last use
+        try:
+            os.utime(self.entry_path(key, '.body'))
+        except OSError:
+            pass
+
+    @staticmethod
+    def response(meta, body):
+        rsp = requests.Response()
+        rsp.status_code = meta['status']
+        rsp.headers = CaseInsensitiveDict(meta['headers'])
+        rsp.encoding = meta['encoding']
+        rsp.url = meta['url']
+        rsp._content = body
+        rsp._content_consumed = True
+        rsp.from_cache = True
+        return rsp
+
+    def request(self, send, url, auth=None, params=None, headers=None, **kwargs):
+        """Perform GET request of `url` with `send(method, url, **kwargs)` unless
+        the cache has a valid response"""
+        prep = PreparedRequest()
+        prep.prepare_url(url, params)
+        key = self.key(prep.url, auth)
+        meta, body = self.load(key)
+
+        headers = dict(headers or {})
+        if meta:
+            validators = False
+            if 'ETag' in meta['headers']:
+                headers['If-None-Match'] = meta['headers']['ETag']
+                validators = True
+            if 'Last-Modified' in meta['headers']:
+                headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+                validators = True
+            if not validators and time.time() - meta['stored'] < self.ttl:
+                logging.debug('using cached response for %s', prep.url)
+                self.touch(key)
+                return self.response(meta, body)
+
+        # body is needed for the cache
+        kwargs.pop('stream', None)
+        rsp = send('GET', url, params=params, headers=headers, **kwargs)
+        if rsp.status_code == 304 and meta:
+            logging.debug('cached response for %s still valid', prep.url)
+            self.touch(key)
+            return self.response(meta, body)
+        if rsp.status_code == 200:
+            try:
+                self.store(key, rsp)
+            except OSError as err:
+                logging.warning('cannot cache response of %s: %s', prep.url, err)
+        return rsp
@@ -0,0 +1,99 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdaptiveLimiter:
+    """Adaptive limit of concurrent in-flight requests, using additive increase,
+    multiplicative decrease (AIMD). The limit grows by roughly 1 for every
+    `limit` successful requests completing within `latency_target` seconds, and
+    is cut by `backoff` factor after 429, 5xx, or a request taking longer than
+    `spike` times the target. Decreases happen at most once per
+    `latency_target`, so a burst of failures of requests that were already in
+    flight counts as one congestion signal."""
+    def __init__(self, initial=4, minimum=1, maximum=256, latency_target=1.0,
+                 backoff=0.5, spike=3.0, clock=time.monotonic):
+        self.limit = float(min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.spike = spike
+        self.clock = clock
+        self.inflight = 0
+        self.last_decrease = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight += 1
+
+    def release(self, latency, status=None, error=False):
+        """Release request slot, `latency` of the request in seconds, `status`
+        being the HTTP status code, `error` set if there was no response"""
+        with self._cond:
+            self.inflight -= 1
+            overloaded = error or status == 429 or (status is not None and status >= 500)
+            if overloaded or latency > self.latency_target * self.spike:
+                now = self.clock()
+                if self.last_decrease is None or \
+                   now - self.last_decrease >= self.latency_target:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.last_decrease = now
+                    logging.debug('concurrency limit decreased to %.1f', self.limit)
+            elif latency <= self.latency_target:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Context manager holding a request slot, yields a callable to be
+        called with the response status code"""
+        self.acquire()
+        start = self.clock()
+        result = {'status': None, 'error': True}
+
+        def done(status):
+            result['status'] = status
+            result['error'] = False
+
+        try:
+            yield done
+        finally:
+            self.release(self.clock() - start, **result)
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def limiter_for(host, **kwargs):
+    """Return limiter for `host`, shared by all sessions in the process"""
+    with limiters_lock:
+        if host not in limiters:
+            limiters[host] = AdaptiveLimiter(**kwargs)
+        return limiters[host]
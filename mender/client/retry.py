@@ -0,0 +1,241 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from mender.client import ClientError
+
+
+def full_jitter(base, attempt, cap, rng=random):
+    """Exponential backoff with full jitter, a random delay between 0 and
+    base * 2^attempt, capped at `cap`"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def jittered(interval, spread=0.5, rng=random):
+    """Randomize `interval` by +/- `spread` fraction, so that periodic actions
+    of many clients do not line up"""
+    return interval * rng.uniform(1 - spread, 1 + spread)
+
+
+def retry_after(rsp):
+    """Return delay in seconds requested by Retry-After header of `rsp` or None"""
+    val = rsp.headers.get('Retry-After')
+    if not val:
+        return None
+    try:
+        return max(float(val), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(val).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestStats:
+    """Thread safe request counters, shared by all sessions of a process"""
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, name, cnt=1):
+        with self._lock:
+            self._counts[name] += cnt
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def __str__(self):
+        counts = self.snapshot()
+        requests = counts.get('requests', 0)
+        amplification = counts.get('attempts', 0) / requests if requests else 0
+        return ', '.join(['{}: {}'.format(k, v) for k, v in sorted(counts.items())] +
+                         ['amplification: {:.2f}'.format(amplification)])
+
+
+stats = RequestStats()
+
+
+class CircuitOpenError(ClientError):
+    """Request not attempted, circuit breaker for the host is open"""
+    pass
+
+
+class CircuitBreaker:
+    """Circuit breaker of a single host. Opens after `threshold` consecutive
+    failures, and lets a single trial request through once `cooldown` seconds
+    passed. The breaker closes again once a trial request succeeds."""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=5, cooldown=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.cooldown:
+                # let one trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    logging.warning('circuit breaker open after %d failures',
+                                    self.failures)
+                    stats.incr('breaker_opened')
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def breaker_for(url, threshold, cooldown):
+    host = urlsplit(url).netloc
+    with breakers_lock:
+        if host not in breakers:
+            breakers[host] = CircuitBreaker(threshold, cooldown)
+        return breakers[host]
+
+
+class RetryPolicy:
+    """Retry policy for API requests. Requests are attempted up to `retries` + 1
+    times with exponential backoff and full jitter between attempts, starting
+    at `backoff` seconds and capped at `max_backoff`. Retry-After is honored.
+
+    Only idempotent requests are retried after failures that the server may
+    have acted upon (5xx, broken connections); any request is retried after 429
+    or a connection that could not be established.
+    """
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+    RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30,
+                 breaker_threshold=5, breaker_cooldown=30, sleep=time.sleep):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = sleep
+
+    def delay(self, attempt, rsp=None):
+        if rsp is not None:
+            after = retry_after(rsp)
+            if after is not None:
+                return min(after, self.max_backoff)
+        return full_jitter(self.backoff, attempt, self.max_backoff)
+
+    def call(self, send, method, url, idempotent=None, **kwargs):
+        """Perform request by calling `send(method, url, **kwargs)` following the
+        policy. Pass `idempotent` to override the guess based on `method`."""
+        if idempotent is None:
+            idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        # a streamed body cannot be sent again
+        retries = self.retries
+        if hasattr(kwargs.get('data'), 'read'):
+            retries = 0
+
+        breaker = None
+        if self.breaker_threshold:
+            breaker = breaker_for(url, self.breaker_threshold, self.breaker_cooldown)
+
+        stats.incr('requests')
+        attempt = 0
+        while True:
+            if breaker and not breaker.allow():
+                stats.incr('breaker_rejected')
+                raise CircuitOpenError('circuit breaker open for {}'.format(url))
+
+            stats.incr('attempts')
+            rsp = None
+            error = None
+            try:
+                rsp = send(method, url, **kwargs)
+            except requests.exceptions.ConnectTimeout as err:
+                # never reached the server
+                failed, retriable = True, True
+                error = err
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as err:
+                failed, retriable = True, idempotent
+                error = err
+            except Exception:
+                # not retried, but the outcome must be recorded, or a trial
+                # request leaves the breaker half open for good
+                if breaker:
+                    breaker.failure()
+                raise
+            else:
+                failed = rsp.status_code in self.RETRY_STATUSES
+                retriable = rsp.status_code == 429 or (failed and idempotent)
+
+            if breaker:
+                if failed:
+                    breaker.failure()
+                else:
+                    breaker.success()
+
+            if not retriable or attempt >= retries:
+                if retriable:
+                    stats.incr('giveups')
+                if error:
+                    raise error
+                return rsp
+
+            delay = self.delay(attempt, rsp)
+            attempt += 1
+            stats.incr('retries')
+            logging.debug('retrying %s %s in %.2fs, attempt %d', method, url,
+                          delay, attempt)
+            if rsp is not None:
+                # release the connection
+                rsp.close()
+            self.sleep(delay)
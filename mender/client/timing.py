@@ -0,0 +1,168 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import logging
+import socket
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+
+# phases of the request being sent by current thread
+current = threading.local()
+
+# callables invoked with (request, timings) for every timed request
+listeners = []
+
+
+def phase(name, duration):
+    timings = getattr(current, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + duration
+
+
+class TimedConnectionMixin:
+    """Records DNS lookup, TCP connect and TLS handshake durations of new
+    connections. Name resolution is done upfront in order to time it
+    separately, resolved addresses are then tried in turn like urllib3 does."""
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = []
+            for info in socket.getaddrinfo(host, self.port, allowed_gai_family(),
+                                           socket.SOCK_STREAM):
+                if info[4][0] not in addresses:
+                    addresses.append(info[4][0])
+        except OSError:
+            # let urllib3 resolve it again and report the error
+            addresses = [host]
+        resolved = time.perf_counter()
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError):
+                    if address == addresses[-1]:
+                        raise
+                    logging.debug('connecting to %s at %s failed, trying next address',
+                                  host, address)
+        finally:
+            self._dns_host = host
+            phase('dns', resolved - start)
+            phase('connect', time.perf_counter() - resolved)
+            phase('new_connection', 1)
+
+    def connect(self):
+        start = time.perf_counter()
+        before = dict(getattr(current, 'timings', None) or {})
+        super().connect()
+        timings = getattr(current, 'timings', None)
+        if timings is not None and isinstance(self, HTTPSConnection):
+            # whatever is not socket setup is TLS
+            tcp = sum(timings.get(k, 0) - before.get(k, 0) for k in ['dns', 'connect'])
+            phase('tls', time.perf_counter() - start - tcp)
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    """HTTP adapter recording durations of request phases, when `timing` is
+    enabled. Timings are available as `timings` attribute of the response, a
+    dict with durations in seconds of:
+
+    dns      - name resolution
+    connect  - TCP connection setup
+    tls      - TLS handshake
+    ttfb     - from connection ready until response headers, which covers
+               sending the request and server processing
+    transfer - reading the response body, None if the response is streamed
+
+    and `reused` set if no new connection was needed.
+
+    With `timing` disabled, the adapter is a plain HTTPAdapter.
+    """
+    def __init__(self, *args, timing=False, **kwargs):
+        self.timing = timing
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        if self.timing:
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': TimedHTTPConnectionPool,
+                'https': TimedHTTPSConnectionPool,
+            }
+
+    def send(self, request, stream=False, **kwargs):
+        if not self.timing:
+            return super().send(request, stream=stream, **kwargs)
+
+        current.timings = timings = {}
+        start = time.perf_counter()
+        try:
+            rsp = super().send(request, stream=stream, **kwargs)
+        finally:
+            current.timings = None
+        headers = time.perf_counter()
+
+        transfer = None
+        if not stream:
+            # the caller would read it right away anyway
+            rsp.content
+            transfer = time.perf_counter() - headers
+
+        setup = sum(timings.get(k, 0) for k in ['dns', 'connect', 'tls'])
+        rsp.timings = {
+            'dns': timings.get('dns', 0.0),
+            'connect': timings.get('connect', 0.0),
+            'tls': timings.get('tls', 0.0),
+            'ttfb': headers - start - setup,
+            'transfer': transfer,
+            'reused': not timings.get('new_connection'),
+        }
+        logging.debug('%s %s: %s', request.method, request.url,
+                      ', '.join('{} {:.1f}ms'.format(k, v * 1000)
+                                if isinstance(v, float) else '{} {}'.format(k, v)
+                                for k, v in rsp.timings.items()))
+        for listener in listeners:
+            listener(request, rsp.timings)
+        return rsp
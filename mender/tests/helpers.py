@@ -0,0 +1,54 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Fakes shared by tests"""
+import datetime
+import io
+import json
+
+import requests
+
+
+def prepared(method, url, body=None, headers=None):
+    """Prepared request, as a response carries it"""
+    return requests.Request(method, url, data=body, headers=headers).prepare()
+
+
+def response(status=200, body=None, headers=None, url=None, request=None):
+    """Response with `body`, bytes or str are used as they are, anything else
+    but None is encoded as JSON"""
+    if body is None:
+        content = b''
+    elif isinstance(body, bytes):
+        content = body
+    elif isinstance(body, str):
+        content = body.encode()
+    else:
+        content = json.dumps(body).encode()
+    rsp = requests.Response()
+    rsp.status_code = status
+    rsp.headers.update(headers or {})
+    rsp._content = content
+    rsp.raw = io.BytesIO(content)
+    rsp.url = url
+    rsp.request = request
+    rsp.elapsed = datetime.timedelta(milliseconds=20)
+    return rsp
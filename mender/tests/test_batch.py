@@ -0,0 +1,110 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from mender.cli import batch, parse_arguments, utils
+from mender.client.timing import TimingAdapter
+from mender.tests.test_utils import make_token
+
+
+class ParseTestCase(unittest.TestCase):
+
+    def test_global_args(self):
+        opts = parse_arguments(['-d', '--cache-dir', 'client', 'client', '-n', '2'])
+        self.assertEqual(opts.command, 'client')
+        self.assertEqual(opts.cache_dir, 'client')
+        self.assertEqual(opts.number, 2)
+        self.assertEqual(opts.global_args, ['-d', '--cache-dir', 'client'])
+
+        opts = parse_arguments(['-d'])
+        self.assertEqual(opts.global_args, ['-d'])
+
+    def test_parse_line(self):
+        self.assertIsNone(batch.parse_line('  '))
+        self.assertIsNone(batch.parse_line('# comment'))
+        self.assertEqual(batch.parse_line("user login -u 'foo bar'"),
+                         (None, ['user', 'login', '-u', 'foo bar']))
+        self.assertEqual(batch.parse_line('["user", "token"]'), (None, ['user', 'token']))
+        self.assertEqual(batch.parse_line('{"id": 3, "args": ["user", "token"]}'),
+                         (3, ['user', 'token']))
+        with self.assertRaises(ValueError):
+            batch.parse_line('[user')
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.token = os.path.join(self.tmpdir, 'usertoken')
+        with open(self.token, 'w') as outf:
+            outf.write(make_token({'sub': 'foo'}))
+
+    def run_batch(self, lines):
+        path = os.path.join(self.tmpdir, 'commands')
+        with open(path, 'w') as outf:
+            outf.write('\n'.join(lines) + '\n')
+        opts = parse_arguments(['-u', self.token, 'batch', '-f', path, '-j', '2'])
+        out = io.StringIO()
+        with mock.patch('sys.stdout', out), mock.patch('sys.stderr', io.StringIO()):
+            opts.verify = True
+            batch.do_main(opts)
+        self.assertIsNone(utils.shared_adapter)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_run(self):
+        results = self.run_batch([
+            'user token',
+            '{"id": "second", "args": ["user", "token"]}',
+            'wait',
+            'user bogus',
+            'batch',
+        ])
+        self.assertEqual([r['line'] for r in results], [1, 2, 4, 5])
+        self.assertEqual(results[1]['id'], 'second')
+        for result in results[:2]:
+            self.assertEqual(result['status'], 'ok')
+            # output of each command is captured separately
+            self.assertEqual(result['output'].count("'sub': 'foo'"), 1)
+        self.assertEqual(results[2]['error'], 'invalid command')
+        self.assertEqual(results[3]['status'], 'error')
+
+    def test_shared_adapter(self):
+        opts = parse_arguments(['user', 'token'])
+        opts.user_token = self.token
+        utils.shared_adapter = adapter = utils.SharedAdapter()
+        self.addCleanup(setattr, utils, 'shared_adapter', None)
+
+        with mock.patch.object(TimingAdapter, 'close') as close:
+            with utils.api_from_opts(opts) as first, utils.api_from_opts(opts) as second:
+                self.assertIs(first.get_adapter('https://foo/'), adapter)
+                self.assertIs(second.get_adapter('http://foo/'), adapter)
+            # sessions are closed, the pool stays
+            close.assert_not_called()
+            adapter.shutdown()
+            close.assert_called_once_with()
@@ -0,0 +1,101 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from mender.cli import parse_arguments
+from mender.cli.utils import api_from_opts
+from mender.client import JWTAuth
+from mender.client.cache import ResponseCache
+from mender.tests.helpers import response
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.path, ttl=60, max_size=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_ttl(self):
+        send = mock.Mock(return_value=response(200, b'[1]'))
+        self.cache.request(send, 'http://foo/bar')
+        rsp = self.cache.request(send, 'http://foo/bar')
+        self.assertEqual(send.call_count, 1)
+        self.assertTrue(rsp.from_cache)
+        self.assertEqual(rsp.json(), [1])
+
+        self.cache.ttl = 0
+        self.cache.request(send, 'http://foo/bar')
+        self.assertEqual(send.call_count, 2)
+
+    def test_revalidate(self):
+        send = mock.Mock(return_value=response(200, b'[1]', {'ETag': '"a"'}))
+        self.cache.request(send, 'http://foo/bar')
+        send.return_value = response(304)
+        rsp = self.cache.request(send, 'http://foo/bar')
+        self.assertEqual(send.call_args[1]['headers'], {'If-None-Match': '"a"'})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.content, b'[1]')
+
+    def test_key(self):
+        send = mock.Mock(return_value=response(200, b'[1]'))
+        self.cache.request(send, 'http://foo/bar', auth=JWTAuth('a'))
+        self.cache.request(send, 'http://foo/bar', auth=JWTAuth('b'))
+        self.cache.request(send, 'http://foo/bar', auth=JWTAuth('b'), params={'page': 2})
+        self.assertEqual(send.call_count, 3)
+
+    def test_errors_not_cached(self):
+        send = mock.Mock(return_value=response(500))
+        self.cache.request(send, 'http://foo/bar')
+        self.cache.request(send, 'http://foo/bar')
+        self.assertEqual(send.call_count, 2)
+
+    def test_evict(self):
+        send = mock.Mock(return_value=response(200, b'x' * 60))
+        self.cache.request(send, 'http://foo/1')
+        os.utime(os.path.join(self.path, self.cache.key('http://foo/1', None) + '.body'),
+                 (0, 0))
+        self.cache.request(send, 'http://foo/2')
+        self.assertFalse(os.path.exists(os.path.join(
+            self.path, self.cache.key('http://foo/1', None) + '.body')))
+        self.cache.request(send, 'http://foo/2')
+        self.assertEqual(send.call_count, 2)
+
+    def test_unusable_dir(self):
+        # cache directory is a file
+        path = os.path.join(self.path, 'file')
+        open(path, 'w').close()
+        opts = parse_arguments(['--cache-dir', path, 'artifact', 'list'])
+        with api_from_opts(opts, cache=True) as api:
+            self.assertIsNone(api.cache)
+
+        # directory gone while in use, the response is still returned
+        shutil.rmtree(self.path)
+        send = mock.Mock(return_value=response(200, b'[1]'))
+        self.assertEqual(self.cache.request(send, 'http://foo/bar').json(), [1])
+        os.mkdir(self.path)
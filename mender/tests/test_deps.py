@@ -0,0 +1,127 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from mender.cli import deps, parse_arguments
+from mender.tests.helpers import response
+
+
+class FakeDeployments:
+    """Deployments service returning given statistics and device lists, one
+    per request"""
+    def __init__(self, stats, devices):
+        self.stats = list(stats)
+        self.devices = list(devices)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append(url.rsplit('/', 1)[1])
+        if url.endswith('/statistics'):
+            return response(200, self.stats.pop(0))
+        return response(200, self.devices.pop(0))
+
+
+class WatchTestCase(unittest.TestCase):
+
+    def watch(self, service, *args):
+        @contextmanager
+        def api_from_opts(opts):
+            yield service
+
+        opts = parse_arguments(['deployment', 'watch', 'foo'] + list(args))
+        out = io.StringIO()
+        with mock.patch.object(deps, 'api_from_opts', api_from_opts), \
+             mock.patch.object(deps.time, 'sleep') as sleep, \
+             mock.patch('sys.stdout', out):
+            deps.do_deployments_watch(opts)
+        return [c[0][0] for c in sleep.call_args_list], out.getvalue()
+
+    def test_adaptive_interval(self):
+        pending = {'pending': 2}
+        service = FakeDeployments(
+            [pending, pending, pending, pending, {'pending': 1, 'downloading': 1},
+             {'success': 1, 'failure': 1}],
+            [[{'id': 'a', 'status': 'pending'}, {'id': 'b', 'status': 'pending'}],
+             [{'id': 'a', 'status': 'downloading'}, {'id': 'b', 'status': 'pending'}],
+             [{'id': 'a', 'status': 'success'}, {'id': 'b', 'status': 'failure'}]])
+        intervals, out = self.watch(service, '--min-interval', '1', '--max-interval', '4')
+        # backs off while nothing changes, polls eagerly again on a change
+        self.assertEqual(intervals, [1, 2, 4, 4, 1])
+        # devices only fetched when statistics changed
+        self.assertEqual(service.requests.count('devices'), 3)
+        self.assertIn('pending: 2 -> 1 (-1)', out)
+        self.assertIn('device a: pending -> downloading', out)
+        self.assertIn('device b: pending -> failure', out)
+        self.assertTrue(out.endswith('deployment finished\n'))
+
+    def test_failure_rate(self):
+        service = FakeDeployments([{'pending': 1, 'failure': 1}], [])
+        intervals, out = self.watch(service, '--no-devices', '--max-failure-rate', '0.4')
+        self.assertEqual(intervals, [])
+        self.assertEqual(service.requests, ['statistics'])
+        self.assertIn('failure rate 50.0% exceeds 40.0%', out)
+
+
+class BreakdownTestCase(unittest.TestCase):
+
+    def test_mixed_types(self):
+        inventory = {
+            'a': {'version': '1'},
+            'b': {'version': 1},
+            'c': {'version': [1, 2]},
+            'd': {},
+        }
+        devices = [('a', 'success'), ('b', 'success'), ('c', 'failure'),
+                   ('d', 'success'), ('e', 'success')]
+        breakdown = deps.join_breakdown(devices, inventory, ['version'])
+        self.assertEqual(breakdown['version']['<undefined>']['success'], 2)
+        self.assertEqual(breakdown['version']['1, 2']['failure'], 1)
+
+        out = io.StringIO()
+        with mock.patch('sys.stdout', out):
+            deps.dump_breakdown(breakdown)
+        lines = out.getvalue().splitlines()
+        # failed first, then ties in order of value as text
+        self.assertEqual([line.split()[0] for line in lines[2:]],
+                         ['1,', '<undefined>', '1', '1'])
+
+    def test_inventory_snapshot(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        devices = [{'id': 'a', 'attributes': [{'name': 'version', 'value': '1'}]},
+                   {'id': 'b'}]
+        # JSON list, NDJSON, NDJSON with a single device
+        for data, count in [(json.dumps(devices), 2),
+                            ('\n'.join(json.dumps(dev) for dev in devices), 2),
+                            (json.dumps(devices[0]) + '\n', 1)]:
+            with open(path, 'w') as outf:
+                outf.write(data)
+            snapshot = deps.load_inventory_snapshot(path)
+            self.assertEqual(snapshot['a'], {'version': '1'})
+            self.assertEqual(len(snapshot), count)
@@ -0,0 +1,109 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from mender.cli import device, parse_arguments
+from mender.tests.test_keys import verify
+from mender.tests.test_utils import make_token
+
+
+class FakeApi:
+    def __init__(self, token):
+        self.token = token
+        self.hooks = {'response': []}
+        self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        self.requests.append((url, data, headers))
+        rsp = requests.Response()
+        rsp.status_code = 200
+        rsp._content = self.token.encode()
+        return rsp
+
+
+class AuthorizeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.addCleanup(device.signed_auth_requests.clear)
+        self.opts = parse_arguments(['device', '-K', 'ed25519',
+                                     '-k', os.path.join(self.tmpdir, 'key'),
+                                     '-o', os.path.join(self.tmpdir, 'token'),
+                                     'authorize', '-m', '00:11:22:33:44:55'])
+        device.do_key(self.opts)
+
+    def test_signed_request_cache(self):
+        with mock.patch.object(device, 'import_privkey',
+                               wraps=device.import_privkey) as import_privkey:
+            data, signature = device.signed_auth_request(self.opts)
+            self.assertEqual(device.signed_auth_request(self.opts), (data, signature))
+            self.assertEqual(import_privkey.call_count, 1)
+
+            request = json.loads(data)
+            self.assertEqual(json.loads(request['id_data']), {'mac': '00:11:22:33:44:55'})
+            self.assertEqual(request['tenant_token'], 'dummy')
+            self.assertTrue(verify(request['pubkey'], data, signature))
+
+            # other tenant
+            self.opts.tenant_token = 'other'
+            self.assertEqual(json.loads(device.signed_auth_request(self.opts)[0])['tenant_token'],
+                             'other')
+            self.assertEqual(import_privkey.call_count, 2)
+
+            # key replaced
+            os.remove(self.opts.device_key)
+            device.do_key(self.opts)
+            data, signature = device.signed_auth_request(self.opts)
+            self.assertNotEqual(json.loads(data)['pubkey'], request['pubkey'])
+            self.assertEqual(import_privkey.call_count, 3)
+
+        os.remove(self.opts.device_key)
+        with self.assertRaises(IOError):
+            device.signed_auth_request(self.opts)
+
+    def test_authorize(self):
+        token = make_token({'sub': 'foo'})
+        api = FakeApi(token)
+        self.addCleanup(device.device_tokens.invalidate, self.opts.device_token)
+        with mock.patch.object(device, 'api_from_opts', return_value=api):
+            self.assertTrue(device.do_authorize(self.opts))
+        url, data, headers = api.requests[0]
+        self.assertTrue(url.endswith('/authentication/auth_requests'))
+        self.assertEqual(headers['X-MEN-Signature'],
+                         device.signed_auth_request(self.opts)[1])
+        with open(self.opts.device_token) as inf:
+            self.assertEqual(inf.read(), token)
+        self.assertEqual(device.device_tokens.get(self.opts.device_token).token, token)
@@ -0,0 +1,86 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import unittest
+
+from mender.cli import scenario
+from mender.cli.devstate import DeviceState, DeviceRandom
+
+
+class DeviceStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.config = argparse.Namespace(seed=3, updates=2, service='http://foo',
+                                         state_dir='/tmp/state')
+
+    def test_config(self):
+        dev = DeviceState(self.config, 5, scenario.Cohort(inventory_update_freq=30))
+        self.assertEqual(dev.service, 'http://foo')
+        self.assertEqual(dev.updates, 2)
+        self.assertEqual(dev.inventory_update_freq, 30)
+        self.assertEqual(dev.device_key, '/tmp/state/5.key')
+        self.assertEqual(dev.device_token, '/tmp/state/5.token')
+        with self.assertRaises(AttributeError):
+            dev.bogus
+        with self.assertRaises(AttributeError):
+            dev.bogus = 1
+
+        dev = DeviceState(self.config, 5, scenario.Cohort(updates=0))
+        self.assertEqual(dev.updates, 0)
+
+    def test_identity(self):
+        first = DeviceState(self.config, 1, scenario.Cohort())
+        self.assertRegex(first.mac_address, '^([0-9a-f]{2}:){5}[0-9a-f]{2}$')
+        self.assertEqual(first.mac_address,
+                         DeviceState(self.config, 1, scenario.Cohort()).mac_address)
+        self.assertNotEqual(first.mac_address,
+                            DeviceState(self.config, 2, scenario.Cohort()).mac_address)
+
+    def test_random(self):
+        rng = DeviceRandom(1)
+        values = [rng.random() for _ in range(1000)]
+        self.assertTrue(all(0 <= v < 1 for v in values))
+        self.assertTrue(0.45 < sum(values) / len(values) < 0.55)
+        self.assertEqual(set(rng.randint(0, 3) for _ in range(200)), {0, 1, 2, 3})
+        self.assertTrue(all(2 <= rng.uniform(2, 3) <= 3 for _ in range(100)))
+        self.assertEqual(DeviceRandom(7).random(), DeviceRandom(7).random())
+
+    def test_distributions(self):
+        rng = DeviceRandom(2)
+        self.assertEqual(set(rng.randrange(10) for _ in range(500)), set(range(10)))
+        self.assertEqual(set(rng.randrange(1, 10, 3) for _ in range(100)), {1, 4, 7})
+        self.assertEqual(set(rng.randrange(5, 0, -2) for _ in range(100)), {5, 3, 1})
+        for args in [(0,), (3, 3), (1, 5, -1), (1, 5, 0)]:
+            with self.assertRaises(ValueError):
+                rng.randrange(*args)
+        big = rng.randrange(1 << 100)
+        self.assertTrue(0 <= big < 1 << 100)
+
+        n = 5000
+        normal = [rng.normalvariate(10, 2) for _ in range(n)]
+        mean = sum(normal) / n
+        stddev = (sum((v - mean) ** 2 for v in normal) / n) ** 0.5
+        self.assertAlmostEqual(mean, 10, delta=0.2)
+        self.assertAlmostEqual(stddev, 2, delta=0.2)
+        expo = [rng.expovariate(0.5) for _ in range(n)]
+        self.assertTrue(all(v >= 0 for v in expo))
+        self.assertAlmostEqual(sum(expo) / n, 2, delta=0.2)
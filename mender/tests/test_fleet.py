@@ -0,0 +1,212 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import itertools
+import json
+import os
+import signal
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from mender.cli import client, device, parse_arguments, scenario, simulation, utils
+from mender.cli.devstate import DeviceState
+from mender.tests.helpers import prepared, response
+from mender.tests.test_utils import make_token
+
+
+class WallClock:
+    """Scheduler stand-in for FakeBackend used by devices on threads"""
+    @property
+    def now(self):
+        return time.monotonic()
+
+
+class FakeServer(requests.adapters.BaseAdapter):
+    """Device API issuing tokens valid for `lifetime` seconds and rejecting
+    expired ones. Inventory updates are answered with `inventory_status`
+    codes in turn, 200 once these run out."""
+    def __init__(self, lifetime=3600):
+        super().__init__()
+        self.lifetime = lifetime
+        self.auths = 0
+        self.rejected = 0
+        self.requests = 0
+        self.inventory_status = []
+        self.inventory = []
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        if self.requests > 50:
+            raise RuntimeError('device keeps hammering the server')
+        now = int(time.time())
+        if request.url.endswith('/auth_requests'):
+            self.auths += 1
+            tok = make_token({'iat': now, 'exp': now + self.lifetime})
+            return response(200, tok, url=request.url, request=request)
+        tok = request.headers['Authorization'].split()[1]
+        if utils.decode_token(tok)[1]['exp'] < now:
+            self.rejected += 1
+            return response(401, url=request.url, request=request)
+        if request.method == 'PATCH':
+            self.inventory.append(json.loads(request.body))
+            status = self.inventory_status.pop(0) if self.inventory_status else 200
+            return response(status, url=request.url, request=request)
+        return response(204, url=request.url, request=request)
+
+    def close(self):
+        pass
+
+
+class FleetStatsTestCase(unittest.TestCase):
+
+    def test_pending_admission(self):
+        stats = client.FleetStats()
+        auth = '/api/devices/v1/authentication/auth_requests'
+        for status in [401, 401, 401, 200]:
+            rsp = response(status, request=prepared('POST', 'https://foo' + auth))
+            stats.record(None, rsp)
+        next_url = 'https://foo/api/devices/v1/deployments/device/deployments/next'
+        stats.record(None, response(500, request=prepared('GET', next_url)))
+        summary = client.fleet_summary(1, 10, client.Fleet(), stats)
+        self.assertEqual(summary['auths'], 1)
+        self.assertEqual(summary['pending_admission'], 3)
+        self.assertEqual(summary['requests'], 5)
+        self.assertEqual(summary['error_rate'], 0.2)
+        self.assertEqual(summary['endpoints']['POST ' + auth]['error_rate'], 0)
+
+
+class FleetRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.scenario = os.path.join(self.tmpdir, 'scenario.json')
+        with open(self.scenario, 'w') as outf:
+            json.dump({'seed': 1, 'cohorts': [{
+                'count': 5,
+                'inventory': {'device_type': 'foo'},
+                'inventory_update_freq': 0.05,
+                'delays': {'poll': 0.01, 'downloading': 0.01, 'rebooting': 0.01},
+            }]}, outf)
+        self.backend = simulation.FakeBackend(WallClock(), deployment_interval=0.05)
+
+    def run_client(self, *args):
+        opts = parse_arguments(['client', '--scenario', self.scenario,
+                                '--crypto-workers', '0'] + list(args))
+        out = io.StringIO()
+        with mock.patch.object(device, 'http_backend', self.backend), \
+             mock.patch('sys.stdout', out):
+            client.do_main(opts)
+        return json.loads(out.getvalue())
+
+    def test_fleet_updates(self):
+        summary = self.run_client('-c', '0', '--fleet-updates', '20')
+        # devices in the middle of an update finish it
+        self.assertTrue(20 <= summary['updates'] < 20 + 5, summary['updates'])
+        self.assertEqual(summary['updates'], self.backend.stats['updates'])
+        self.assertEqual(summary['devices'], 5)
+        self.assertEqual(summary['failed_devices'], 0)
+        self.assertGreater(self.backend.stats['inventory'], 0)
+
+    def test_duration(self):
+        start = time.monotonic()
+        summary = self.run_client('-c', '0', '--duration', '0.3')
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertGreater(summary['updates'], 0)
+        self.assertEqual(summary['updates'], self.backend.stats['updates'])
+        self.assertTrue(0.3 <= summary['seconds'] < 5)
+
+    def test_signal_drain(self):
+        fleet = client.Fleet()
+        previous = client.handle_signals(fleet)
+        try:
+            signal.raise_signal(signal.SIGINT)
+            self.assertTrue(fleet.stop.is_set())
+            # second one aborts
+            with self.assertRaises(KeyboardInterrupt):
+                signal.raise_signal(signal.SIGTERM)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+
+class HttpDeviceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.server = FakeServer()
+        utils.shared_adapter = self.server
+        self.addCleanup(setattr, utils, 'shared_adapter', None)
+        opts = parse_arguments(['client', '-K', 'ed25519', '--crypto-workers', '0',
+                                '--inventory-jitter', '0', '--inventory-delta'])
+        self.dev = DeviceState(client.fleet_config(opts, 1, tmpdir), 0,
+                               scenario.Cohort(inventory={'device_type': 'foo'}))
+
+    def run_device(self, token, delays):
+        with open(self.dev.device_token, 'w') as outf:
+            outf.write(token)
+        return list(itertools.islice(
+            client.device_lifecycle(self.dev, device.http_backend, client.Fleet()),
+            delays))
+
+    def test_expired_token(self):
+        now = int(time.time())
+        delays = self.run_device(make_token({'iat': now - 7200, 'exp': now - 3600}), 3)
+        self.assertEqual(len(delays), 3)
+        self.assertEqual(self.server.rejected, 1)
+        self.assertEqual(self.server.auths, 1)
+
+    def test_token_refresh(self):
+        now = int(time.time())
+        delays = self.run_device(make_token({'iat': now - 1000, 'exp': now + 50}), 3)
+        self.assertEqual(len(delays), 3)
+        self.assertEqual(self.server.rejected, 0)
+        self.assertEqual(self.server.auths, 1)
+
+    def test_rejected_token(self):
+        # tokens expired on arrival, the device backs off before each attempt
+        self.server.lifetime = -1
+        now = int(time.time())
+        delays = self.run_device(make_token({'iat': now - 7200, 'exp': now - 3600}), 3)
+        self.assertEqual(len(delays), 3)
+        self.assertEqual(self.server.rejected, 3)
+        self.assertEqual(self.server.auths, 2)
+
+    def test_inventory_failure(self):
+        now = int(time.time())
+        with open(self.dev.device_token, 'w') as outf:
+            outf.write(make_token({'iat': now, 'exp': now + 3600}))
+        self.server.inventory_status = [500]
+        fleet = client.Fleet()
+        lifecycle = client.inventory_lifecycle(self.dev, device.http_backend, fleet)
+        list(itertools.islice(lifecycle, 4))
+        self.assertEqual(fleet.inventory_failures, 1)
+        # failed report is sent again in full, then nothing changed
+        self.assertEqual(len(self.server.inventory), 2)
+        self.assertEqual(self.server.inventory[0], self.server.inventory[1])
+        self.assertIn({'name': 'device_type', 'value': 'foo'}, self.server.inventory[0])
@@ -0,0 +1,138 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+from mender.cli import inventory
+from mender.tests.helpers import response
+
+
+class FakeInventory:
+    """Inventory service with a single group, paginated by offset"""
+    def __init__(self, group, devices):
+        self.group = group
+        self.members = list(devices)
+        self.bodies = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        path = urlparse(url).path
+        with self.lock:
+            if method == 'GET':
+                params = params or {k: int(v[0]) for k, v in parse_qs(urlparse(url).query).items()}
+                start = (params['page'] - 1) * params['per_page']
+                return response(200, self.members[start:start + params['per_page']])
+            devid = path.split('/devices/')[1].split('/')[0]
+            self.bodies.append(json)
+            self.members.remove(devid)
+            return response(204)
+
+
+class FakeDevices:
+    """Inventory service with group members listed in `pages` and devices in
+    `devices`, missing ones are not found"""
+    def __init__(self, pages, devices):
+        self.pages = pages
+        self.devices = devices
+
+    def request(self, method, url, params=None, **kwargs):
+        path = urlparse(url).path
+        if '/groups/' in path:
+            return response(200, self.pages[params['page'] - 1])
+        devid = path.rsplit('/', 1)[1]
+        if devid not in self.devices:
+            return response(404, {'error': 'not found'})
+        return response(200, self.devices[devid])
+
+
+class GroupShowTestCase(unittest.TestCase):
+
+    def setUp(self):
+        def device(devid, device_type):
+            return {'id': devid, 'updated_ts': '2016-01-01T00:00:00Z',
+                    'attributes': [{'name': 'device_type', 'value': device_type}]}
+
+        # group changing while listed, a device shows up on two pages
+        self.service = FakeDevices([['a', 'b'], ['b', 'c'], []],
+                                   {'a': device('a', 'foo'), 'b': device('b', 'bar')})
+
+    def show(self, *args):
+        @contextmanager
+        def api_from_opts(opts, pool_size=None):
+            yield self.service
+
+        opts = argparse.Namespace(service='http://foo', jobs=2, per_page=2, **dict(args))
+        out = io.StringIO()
+        with mock.patch.object(inventory, 'api_from_opts', api_from_opts), \
+             mock.patch('sys.stdout', out):
+            inventory.group_show_expanded(opts, 'http://foo/api/management/v1/inventory/groups/g/devices')
+        return out.getvalue().splitlines()
+
+    def test_table(self):
+        lines = self.show(('attributes', 'id, device_type'), ('format', 'plain'))
+        self.assertEqual(lines[0].split(), ['id', 'device_type'])
+        # missing device skipped
+        self.assertEqual(sorted(line.split() for line in lines[1:]),
+                         [['a', 'foo'], ['b', 'bar']])
+
+    def test_ndjson(self):
+        lines = self.show(('attributes', 'id'), ('format', 'ndjson'))
+        self.assertEqual(sorted(json.loads(line)['id'] for line in lines), ['a', 'b'])
+
+
+class GroupBulkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.journal = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.journal)
+
+    def tearDown(self):
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+
+    def run_bulk(self, service, **kwargs):
+        @contextmanager
+        def api_from_opts(opts, pool_size=None):
+            yield service
+
+        opts = argparse.Namespace(service='http://foo', journal=self.journal,
+                                  jobs=4, file=None, **kwargs)
+        with mock.patch.object(inventory, 'api_from_opts', api_from_opts), \
+             mock.patch('builtins.print'):
+            inventory.group_bulk(opts)
+
+    def test_remove_from_group(self):
+        service = FakeInventory('foo', ['dev-{}'.format(i) for i in range(1200)])
+        self.run_bulk(service, invgrcommand='remove', group='foo', from_group='foo')
+        # all members visited though membership changed while paging
+        self.assertEqual(service.members, [])
+        self.assertEqual(service.bodies, [None] * 1200)
+        self.assertFalse(os.path.exists(self.journal))
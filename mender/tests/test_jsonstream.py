@@ -0,0 +1,79 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import json
+import unittest
+
+from mender.cli.jsonstream import JSONReformatter
+
+
+DOCS = [
+    {},
+    [],
+    'foo',
+    12.5e-3,
+    None,
+    [1, True, False, None, -3],
+    {'id': 'abc', 'attributes': [{'name': 'mac', 'value': 'de:ad:be:ef'},
+                                 {'name': 'esc"aped\\', 'value': ['a', 'b\n']}],
+     'empty': {}, 'list': [], 'nested': [[[]], [{}]]},
+    [{'id': i, 'status': 'success', 'sub': {'x': [i] * i}} for i in range(20)],
+]
+
+
+def reformat(text, mode, chunk=7):
+    out = io.StringIO()
+    fmt = JSONReformatter(out, mode=mode)
+    for p in range(0, len(text), chunk):
+        fmt.feed(text[p:p + chunk])
+    fmt.finish()
+    return out.getvalue()
+
+
+class JSONReformatterTestCase(unittest.TestCase):
+
+    def test_pretty(self):
+        for doc in DOCS:
+            for chunk in [1, 3, 1000]:
+                self.assertEqual(reformat(json.dumps(doc), 'pretty', chunk),
+                                 json.dumps(doc, indent=4) + '\n')
+
+    def test_compact(self):
+        for doc in DOCS:
+            self.assertEqual(reformat(json.dumps(doc, indent=2), 'compact'),
+                             json.dumps(doc, separators=(',', ':')) + '\n')
+
+    def test_ndjson(self):
+        for doc in DOCS:
+            out = reformat(json.dumps(doc), 'ndjson', chunk=5)
+            if isinstance(doc, list):
+                self.assertEqual([json.loads(line) for line in out.splitlines()], doc)
+            else:
+                self.assertEqual(out, json.dumps(doc, separators=(',', ':')) + '\n')
+
+    def test_not_json(self):
+        with self.assertRaises(ValueError):
+            reformat('<html></html>', 'pretty')
+        with self.assertRaises(ValueError):
+            reformat('{"foo": [1, 2', 'pretty')
+        with self.assertRaises(ValueError):
+            reformat('{} {}', 'compact')
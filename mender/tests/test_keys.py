@@ -0,0 +1,73 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import unittest
+from base64 import b64decode
+
+from Crypto.Hash import SHA256
+from Crypto.Signature import DSS, PKCS1_v1_5, eddsa
+
+from mender.cli import keys
+
+
+def verify(pubkey, data, signature):
+    """Verify Base64 encoded `signature` of `data` as a server would"""
+    key = keys.import_key(pubkey)
+    signature = b64decode(signature)
+    try:
+        if keys.is_rsa(key):
+            return PKCS1_v1_5.new(key).verify(SHA256.new(data.encode()), signature)
+        if key.curve == 'Ed25519':
+            eddsa.new(key, 'rfc8032').verify(data.encode(), signature)
+        else:
+            DSS.new(key, 'fips-186-3', encoding='der').verify(SHA256.new(data.encode()),
+                                                            signature)
+    except ValueError:
+        return False
+    return True
+
+
+class KeysTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = '{"mac": "00:11:22:33:44:55"}'
+        fingerprints = set()
+        for key_type in keys.KEY_TYPES:
+            with self.subTest(key_type=key_type):
+                pem = keys.gen_privkey(key_type)
+                key = keys.import_key(pem)
+                pubkey = keys.export_pubkey(key)
+                self.assertIn('-----BEGIN PUBLIC KEY-----', pubkey)
+
+                fingerprint = keys.fingerprint(pubkey)
+                self.assertEqual(len(fingerprint), 20)
+                self.assertEqual(keys.fingerprint(keys.export_pubkey(keys.import_key(pem))),
+                                 fingerprint)
+                fingerprints.add(fingerprint)
+
+                signature = keys.sign(data, key)
+                self.assertTrue(verify(pubkey, data, signature))
+                self.assertFalse(verify(pubkey, data + ' ', signature))
+        self.assertEqual(len(fingerprints), len(keys.KEY_TYPES))
+
+    def test_unsupported(self):
+        with self.assertRaises(keys.UnsupportedKeyTypeError):
+            keys.gen_privkey('dsa')
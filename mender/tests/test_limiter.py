@@ -0,0 +1,81 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+import unittest
+
+from mender.client.limiter import AdaptiveLimiter
+
+
+class AdaptiveLimiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.limiter = AdaptiveLimiter(initial=4, maximum=8, latency_target=1.0,
+                                       clock=lambda: self.now)
+
+    def request(self, latency=0.1, status=200, error=False):
+        self.limiter.acquire()
+        self.limiter.release(latency, status=status, error=error)
+
+    def test_additive_increase(self):
+        for _ in range(4):
+            self.request()
+        self.assertAlmostEqual(self.limiter.limit, 5, delta=0.1)
+
+        for _ in range(1000):
+            self.request()
+        self.assertEqual(self.limiter.limit, 8)
+
+    def test_multiplicative_decrease(self):
+        self.request(status=503)
+        self.assertEqual(self.limiter.limit, 2)
+        # within the same latency target window
+        self.request(status=429)
+        self.assertEqual(self.limiter.limit, 2)
+
+        self.now = 1
+        self.request(latency=5)
+        self.assertEqual(self.limiter.limit, 1)
+        self.now = 2
+        self.request(status=None, error=True)
+        self.assertEqual(self.limiter.limit, 1)
+
+    def test_slow_but_tolerable(self):
+        # between target and spike, limit stays put
+        self.request(latency=2)
+        self.assertEqual(self.limiter.limit, 4)
+
+    def test_blocks_over_limit(self):
+        for _ in range(4):
+            self.limiter.acquire()
+        acquired = threading.Event()
+
+        def waiter():
+            self.limiter.acquire()
+            acquired.set()
+
+        t = threading.Thread(target=waiter)
+        t.start()
+        self.assertFalse(acquired.wait(0.1))
+        self.limiter.release(0.1, status=200)
+        self.assertTrue(acquired.wait(1))
+        t.join()
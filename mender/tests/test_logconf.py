@@ -0,0 +1,102 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import json
+import logging
+import unittest
+
+from mender.cli import logconf
+
+
+def record(msg, *args, level=logging.INFO):
+    return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+
+class RateLimitFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.filter = logconf.RateLimitFilter(rate=1, burst=2, sample=3,
+                                              clock=lambda: self.now)
+
+    def passed(self, msg, count, level=logging.INFO):
+        return [r for r in (record(msg, i, level=level) for i in range(count))
+                if self.filter.filter(r)]
+
+    def test_limit(self):
+        # burst, then 1 of 3 with the count of suppressed ones
+        passed = self.passed('device %d polling', 8)
+        self.assertEqual([r.args[0] for r in passed], [0, 1, 4, 7])
+        self.assertEqual([getattr(r, 'suppressed', 0) for r in passed], [0, 0, 2, 2])
+        # other kinds are not affected
+        self.assertEqual(len(self.passed('device %d rebooting', 2)), 2)
+        self.assertEqual(len(self.passed('device %d failed', 5, logging.WARNING)), 5)
+
+        # refilled, suppressed count is reported with the first one passing
+        self.passed('device %d polling', 1)
+        self.now = 1
+        passed = self.passed('device %d polling', 2)
+        self.assertEqual(len(passed), 1)
+        self.assertEqual(passed[0].suppressed, 1)
+
+    def test_no_sampling(self):
+        self.filter.sample = 0
+        self.assertEqual(len(self.passed('device %d polling', 100)), 2)
+
+
+class SetupTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.setLevel(logging.WARNING)
+
+    def test_json(self):
+        out = io.StringIO()
+        listener = logconf.setup(logging.INFO, json_format=True, rate=1,
+                                 burst=1, sample=2, stream=out)
+        for i in range(3):
+            logging.info('device %d polling', i)
+        logging.debug('hidden')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logging.exception('failed')
+        listener.stop()
+
+        entries = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([e['message'] for e in entries],
+                         ['device 0 polling', 'device 2 polling', 'failed'])
+        self.assertEqual(entries[1]['suppressed'], 1)
+        self.assertEqual(entries[2]['level'], 'ERROR')
+        self.assertIn('ValueError: boom', entries[2]['exception'])
+
+    def test_text(self):
+        out = io.StringIO()
+        listener = logconf.setup(logging.INFO, rate=0, stream=out)
+        for i in range(50):
+            logging.info('device %d polling', i)
+        listener.stop()
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(lines[0], 'INFO:root:device 0 polling')
@@ -0,0 +1,78 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mender.cli import profiling
+
+
+def busy_worker():
+    time.sleep(0.01)
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_profiler(self):
+        path = os.path.join(self.tmpdir, 'profile')
+        profiler = profiling.Profiler(memory_top=5)
+        profiler.start()
+        thread = threading.Thread(target=busy_worker)
+        thread.start()
+        thread.join()
+        profiler.stop(path)
+
+        stats = pstats.Stats(path)
+        functions = [func for _, _, func in stats.stats]
+        # the thread is covered too
+        self.assertIn('busy_worker', functions)
+        with open(path + '.memory') as inf:
+            self.assertEqual(len(inf.readlines()), 5)
+
+    def test_trace(self):
+        self.assertIs(profiling.span('foo'), profiling.NO_SPAN)
+
+        profiling.tracer = profiling.Tracer()
+        self.addCleanup(setattr, profiling, 'tracer', None)
+        with profiling.span('outer', url='http://foo'):
+            with profiling.span('inner', 'network'):
+                pass
+        path = os.path.join(self.tmpdir, 'trace.json')
+        profiling.tracer.write(path)
+
+        with open(path) as inf:
+            events = json.load(inf)['traceEvents']
+        self.assertEqual([(e['name'], e['cat']) for e in events],
+                         [('inner', 'network'), ('outer', 'cli')])
+        inner, outer = events
+        self.assertEqual(outer['args'], {'url': 'http://foo'})
+        self.assertTrue(outer['ts'] <= inner['ts'])
+        self.assertTrue(inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur'])
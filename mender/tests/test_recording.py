@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import gzip
+import os
+import tempfile
+import unittest
+
+from mender.cli import recording, replay
+from mender.tests.helpers import prepared, response
+
+
+class RecordingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.ndjson.gz')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_record(self):
+        rec = recording.Recorder(self.path)
+        rec.record('dev1', response(200, request=prepared(
+            'POST', 'http://foo/api/auth_requests', '{"a": 1}',
+            headers={'X-MEN-Signature': b'sig', 'Authorization': 'Bearer tok'})))
+        rec.record('dev1', response(204, request=prepared(
+            'PUT', 'http://foo/api/status?x=1', '{"a": 1}')))
+        rec.record('dev2', response(204, request=prepared('GET', 'http://foo/api/next')))
+        rec.close()
+
+        with gzip.open(self.path, 'rt') as inf:
+            # body stored once
+            self.assertEqual(len(inf.readlines()), 4)
+
+        events = list(recording.read_trace(self.path))
+        self.assertEqual([(e['device'], e['method'], e['path'], e['status'])
+                          for e in events],
+                         [('dev1', 'POST', '/api/auth_requests', 200),
+                          ('dev1', 'PUT', '/api/status?x=1', 204),
+                          ('dev2', 'GET', '/api/next', 204)])
+        self.assertEqual(events[0]['headers'], {'X-MEN-Signature': 'sig'})
+        self.assertEqual(events[1]['body'], b'{"a": 1}')
+        self.assertEqual(events[2]['body'], b'')
+        self.assertEqual(events[0]['latency'], 0.02)
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def test_speed(self):
+        self.assertEqual(replay.speed('max'), 0)
+        self.assertEqual(replay.speed('4x'), 4)
+        self.assertEqual(replay.speed('0.5'), 0.5)
+        for val in ['0', 'foo', '-1x']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                replay.speed(val)
+
+    def test_endpoint(self):
+        self.assertEqual(replay.endpoint('PUT', '/api/devices/v1/deployments/device/deployments/'
+                                         '0c13a0e6-6b63-40b5-9ba5-30e4d5f59e42/status?a=b'),
+                         'PUT /api/devices/v1/deployments/device/deployments/:id/status')
+
+    def test_percentile(self):
+        self.assertIsNone(replay.percentile([], 50))
+        self.assertEqual(replay.percentile(list(range(100)), 95), 95)
+        self.assertEqual(replay.percentile([1], 95), 1)
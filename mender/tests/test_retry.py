@@ -0,0 +1,123 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import unittest
+import mock
+
+import requests
+
+from mender.client import retry
+from mender.tests.helpers import response
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sleep = mock.Mock()
+        self.policy = retry.RetryPolicy(retries=3, breaker_threshold=0,
+                                        sleep=self.sleep)
+
+    def test_success(self):
+        send = mock.Mock(return_value=response(200))
+        self.assertEqual(self.policy.call(send, 'GET', 'http://foo/').status_code, 200)
+        self.assertEqual(send.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_retry_idempotent(self):
+        send = mock.Mock(side_effect=[response(503), response(502), response(200)])
+        self.assertEqual(self.policy.call(send, 'GET', 'http://foo/').status_code, 200)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_giveup(self):
+        send = mock.Mock(return_value=response(503))
+        self.assertEqual(self.policy.call(send, 'PUT', 'http://foo/').status_code, 503)
+        self.assertEqual(send.call_count, 4)
+
+    def test_no_retry_post(self):
+        send = mock.Mock(return_value=response(503))
+        self.assertEqual(self.policy.call(send, 'POST', 'http://foo/').status_code, 503)
+        self.assertEqual(send.call_count, 1)
+
+        send = mock.Mock(side_effect=[response(503), response(200)])
+        self.policy.call(send, 'POST', 'http://foo/', idempotent=True)
+        self.assertEqual(send.call_count, 2)
+
+    def test_retry_after(self):
+        send = mock.Mock(side_effect=[response(429, headers={'Retry-After': '7'}),
+                                      response(200)])
+        self.assertEqual(self.policy.call(send, 'POST', 'http://foo/').status_code, 200)
+        self.sleep.assert_called_once_with(7.0)
+
+    def test_connection_error(self):
+        send = mock.Mock(side_effect=requests.exceptions.ConnectionError('foo'))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.policy.call(send, 'POST', 'http://foo/')
+        self.assertEqual(send.call_count, 1)
+
+        send = mock.Mock(side_effect=[requests.exceptions.ConnectTimeout('foo'),
+                                      response(201)])
+        self.assertEqual(self.policy.call(send, 'POST', 'http://foo/').status_code, 201)
+
+    def test_backoff(self):
+        for attempt in range(10):
+            delay = retry.full_jitter(0.5, attempt, 30)
+            self.assertTrue(0 <= delay <= min(30, 0.5 * 2 ** attempt))
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def test_breaker(self):
+        now = [0]
+        breaker = retry.CircuitBreaker(threshold=2, cooldown=10, clock=lambda: now[0])
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10
+        # single trial request
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_breaker_unexpected_error(self):
+        policy = retry.RetryPolicy(retries=0, breaker_threshold=1,
+                                   breaker_cooldown=0, sleep=mock.Mock())
+        url = 'http://breaker-unexpected/'
+        self.addCleanup(retry.breakers.pop, 'breaker-unexpected', None)
+        send = mock.Mock(side_effect=[response(503),
+                                      requests.exceptions.ChunkedEncodingError(),
+                                      response(200)])
+        self.assertEqual(policy.call(send, 'GET', url).status_code, 503)
+        # the trial request fails in an unexpected way, the next one is a
+        # trial again rather than rejected for good
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            policy.call(send, 'GET', url)
+        self.assertEqual(policy.call(send, 'GET', url).status_code, 200)
@@ -0,0 +1,97 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import random
+import tempfile
+import unittest
+
+from mender.cli import scenario
+from mender.cli.devstate import device_rng
+
+
+SCENARIO = {
+    'seed': 7,
+    'cohorts': [
+        {'name': 'a', 'count': 2, 'inventory': {'serial': '{cohort}-{index}'}},
+        {'name': 'b', 'count': 1, 'failure_probability': 1,
+         'delays': {'rebooting': {'dist': 'normal', 'mean': 10, 'stddev': 1}},
+         'reboot': {'reauthorize': True}},
+    ],
+}
+
+
+class ScenarioTestCase(unittest.TestCase):
+
+    def load(self, spec):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as outf:
+            json.dump(spec, outf)
+            outf.flush()
+            return scenario.load(outf.name)
+
+    def test_load(self):
+        scen = self.load(SCENARIO)
+        self.assertEqual(scen.seed, 7)
+        self.assertEqual(scen.size(), 3)
+        devices = list(scen.devices())
+        self.assertEqual([(i, c.name) for i, c in devices], [(0, 'a'), (1, 'a'), (2, 'b')])
+        self.assertEqual(devices[1][1].inventory_attrs(1, 'mac'),
+                         [{'name': 'serial', 'value': 'a-1'}])
+        self.assertTrue(devices[2][1].fails(random))
+        self.assertTrue(devices[2][1].reauthorize_on_reboot())
+        self.assertFalse(devices[0][1].fails(random))
+
+    def test_invalid(self):
+        for spec in [{}, {'cohorts': [{'bogus': 1}]},
+                     {'cohorts': [{'delays': {'foo': 1}}]},
+                     {'cohorts': [{'delays': {'poll': {'dist': 'uniform'}}}]},
+                     # malformed
+                     {'cohorts': 'a'}, {'cohorts': [{'delays': {'poll': 'fast'}}]},
+                     {'cohorts': [{'delays': [1]}]}, {'cohorts': [{'reboot': True}]},
+                     {'cohorts': [{'delays': {'poll': {'dist': 'uniform', 'max': 'x'}}}]}]:
+            with self.assertRaises(scenario.ScenarioError):
+                self.load(spec)
+
+    def test_template(self):
+        cohort = scenario.Cohort(inventory_template='realistic',
+                                 inventory={'device_type': 'foo'})
+        attrs = dict((a['name'], a['value']) for a in cohort.inventory_attrs(3, 'aa', seed=1))
+        self.assertEqual(attrs['device_type'], 'foo')
+        self.assertEqual(attrs['mac_eth0'], 'aa')
+        self.assertGreater(len(attrs), 20)
+
+    def test_reproducible(self):
+        cohort = self.load(SCENARIO).cohorts[1]
+
+        def run(seed):
+            rng = device_rng(seed, 2)
+            return [cohort.delay(s, rng) for s in scenario.STATES]
+
+        self.assertEqual(run(7), run(7))
+        self.assertNotEqual(run(7), run(8))
+        self.assertNotEqual(device_rng(7, 1).random(), device_rng(7, 2).random())
+
+    def test_delay(self):
+        rng = random.Random(1)
+        self.assertEqual(scenario.Delay(3).sample(rng), 3)
+        for _ in range(100):
+            self.assertTrue(1 <= scenario.Delay({'dist': 'uniform', 'min': 1, 'max': 2}).sample(rng) <= 2)
+            self.assertTrue(scenario.Delay({'dist': 'normal', 'mean': 0, 'stddev': 5}).sample(rng) >= 0)
@@ -0,0 +1,74 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import shutil
+import tempfile
+import unittest
+
+from mender.cli import device, keys, parse_arguments, signing
+from mender.tests.test_keys import verify
+
+
+class SigningTestCase(unittest.TestCase):
+
+    def test_run_batch(self):
+        pem = keys.gen_privkey('ed25519')
+        results = signing.run_batch([('sign', ('foo', pem)), ('bogus', ())])
+        self.assertEqual(results[0], (None, device.sign('foo', keys.import_key(pem))))
+        self.assertIsInstance(results[1][0], ValueError)
+
+
+class SigningServiceTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.service = signing.SigningService(workers=2, batch_size=4)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.service.shutdown()
+
+    def test_sign(self):
+        pem = self.service.gen_privkey('ed25519')
+        pubkey = keys.export_pubkey(keys.import_key(pem))
+        futures = [self.service.submit('sign', 'data {}'.format(i), pem) for i in range(20)]
+        for i, fut in enumerate(futures):
+            self.assertTrue(verify(pubkey, 'data {}'.format(i), fut.result()))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.service.submit('bogus').result()
+        with self.assertRaises(keys.UnsupportedKeyTypeError):
+            self.service.gen_privkey('dsa')
+
+    def test_device(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(device.signed_auth_requests.clear)
+        opts = parse_arguments(['device', '-K', 'ed25519', '-k', os.path.join(tmpdir, 'key'),
+                                'authorize'])
+        device.signing_service = self.service
+        self.addCleanup(setattr, device, 'signing_service', None)
+        # key generated and request signed by workers
+        device.do_key(opts)
+        data, signature = device.signed_auth_request(opts)
+        self.assertEqual(signature, device.sign(data, device.load_privkey(opts.device_key)))
@@ -0,0 +1,169 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import unittest
+
+import requests
+
+from mender.cli import client, scenario, simulation
+from mender.client.retry import CircuitOpenError
+
+
+def fleet(count=10, seed=1, **cohort):
+    cohort.setdefault('delays', {'poll': 60, 'downloading': 30, 'rebooting': 30})
+    return scenario.Scenario([scenario.Cohort(count=count, **cohort)], seed=seed)
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def test_order(self):
+        sched = simulation.Scheduler()
+        log = []
+
+        def proc(name, delays):
+            for d in delays:
+                yield d
+                log.append((sched.now, name))
+
+        sched.spawn(proc('a', [3, 3]))
+        sched.spawn(proc('b', [1, 1, 10]))
+        sched.run(until=10)
+        self.assertEqual(log, [(1, 'b'), (2, 'b'), (3, 'a'), (6, 'a')])
+        self.assertEqual(sched.now, 10)
+        sched.run()
+        self.assertEqual(log[-1], (12, 'b'))
+
+
+class SimulationTestCase(unittest.TestCase):
+
+    def run_fleet(self, scen, duration, updates=0, fleet=None, jitter=0, delta=False,
+                  **kwargs):
+        opts = argparse.Namespace(updates=updates, inventory_update_freq=60,
+                                  inventory_jitter=jitter, inventory_delta=delta)
+        backend = simulation.FakeBackend(None, **kwargs)
+        return simulation.simulate(scen, opts, backend=backend, duration=duration,
+                                   fleet=fleet)
+
+    def test_updates(self):
+        sched, backend = self.run_fleet(fleet(inventory={'device_type': 'foo'},
+                                              inventory_update_freq=600), 4 * 3600,
+                                        deployment_interval=3600)
+        # a deployment every hour, first one at start
+        self.assertEqual(backend.stats['updates'], 10 * 4)
+        self.assertEqual(backend.stats['auths'], 10)
+        self.assertEqual(backend.stats['unauthorized'], 0)
+        self.assertEqual(backend.stats['inventory'], 10 * 24)
+
+    def test_updates_limit(self):
+        sched, backend = self.run_fleet(fleet(), 4 * 3600, updates=2)
+        self.assertEqual(backend.stats['updates'], 20)
+        # devices and inventory reporters are done
+        self.assertEqual(sched.queue, [])
+
+    def test_token_expiry(self):
+        sched, backend = self.run_fleet(fleet(), 10 * 3600,
+                                        token_lifetime=3600, deployment_interval=1e9)
+        # tokens are renewed before they expire
+        self.assertEqual(backend.stats['unauthorized'], 0)
+        self.assertGreaterEqual(backend.stats['auths'], 10 * 10)
+
+    def test_admission(self):
+        sched, backend = self.run_fleet(fleet(), 3600, admission_delay=300)
+        self.assertEqual(backend.stats['auths'], 10)
+        self.assertGreater(backend.stats['auth_requests'], 10)
+
+    def test_reproducible(self):
+        scen = fleet(failure_probability=0.5,
+                     delays={'poll': {'dist': 'exponential', 'mean': 60}})
+        _, first = self.run_fleet(scen, 6 * 3600, deployment_interval=600)
+        _, second = self.run_fleet(scen, 6 * 3600, deployment_interval=600)
+        self.assertEqual(first.stats, second.stats)
+        self.assertGreater(first.stats['status_failure'], 0)
+
+    def test_fleet_target(self):
+        state = client.Fleet(target=25)
+        sched, backend = self.run_fleet(fleet(), 24 * 3600, fleet=state,
+                                        deployment_interval=600)
+        self.assertTrue(state.stop.is_set())
+        # devices in the middle of an update finish it
+        self.assertGreaterEqual(state.updates, 25)
+        self.assertLess(state.updates, 25 + 10)
+        self.assertEqual(backend.stats['updates'], state.updates)
+        self.assertEqual(sched.queue, [])
+        self.assertLess(sched.now, 24 * 3600)
+
+    def test_outage(self):
+        backend = simulation.FakeBackend(None, deployment_interval=3600)
+        next_update = backend.next_update
+
+        def unavailable(opts):
+            if 1800 <= backend.scheduler.now < 2400:
+                raise CircuitOpenError('circuit breaker open')
+            return next_update(opts)
+        backend.next_update = unavailable
+        state = client.Fleet()
+        opts = argparse.Namespace(updates=0, inventory_update_freq=60,
+                                  inventory_jitter=0, inventory_delta=False)
+        simulation.simulate(fleet(), opts, backend=backend, duration=4 * 3600,
+                            fleet=state)
+        # devices wait the outage out and keep updating, without authorizing again
+        self.assertEqual(state.failed, 0)
+        self.assertEqual(backend.stats['updates'], 10 * 4)
+        self.assertEqual(backend.stats['auths'], 10)
+
+    def test_inventory_failure(self):
+        backend = simulation.FakeBackend(None)
+        inventory = backend.inventory
+
+        def unreachable(opts, attrs):
+            if 1800 <= backend.scheduler.now < 2400:
+                raise requests.exceptions.ConnectionError('connection refused')
+            return inventory(opts, attrs)
+        backend.inventory = unreachable
+        state = client.Fleet()
+        opts = argparse.Namespace(updates=0, inventory_update_freq=600,
+                                  inventory_jitter=0, inventory_delta=False)
+        simulation.simulate(fleet(inventory={'device_type': 'foo'}, inventory_update_freq=600),
+                            opts, backend=backend, duration=4 * 3600 - 1, fleet=state)
+        # failures are counted and retried until the report at 1800 goes
+        # through at 2400, one report is lost
+        self.assertGreater(state.inventory_failures, 10 * 10)
+        self.assertEqual(backend.stats['inventory'], 10 * 22)
+        self.assertEqual(state.failed, 0)
+
+    def test_inventory(self):
+        scen = fleet(inventory={'device_type': 'foo', 'serial': '{index}'},
+                     inventory_update_freq=600)
+        _, backend = self.run_fleet(scen, 4 * 3600 - 1, delta=True)
+        # full report first, nothing changes later
+        self.assertEqual(backend.stats['inventory'], 10)
+        self.assertEqual(backend.stats['inventory_attrs'], 20)
+
+        reports = []
+        backend = simulation.FakeBackend(None)
+        backend.inventory = lambda opts, attrs: reports.append(backend.scheduler.now)
+        opts = argparse.Namespace(updates=0, inventory_update_freq=600,
+                                  inventory_jitter=0.2, inventory_delta=False)
+        simulation.simulate(scen, opts, backend=backend, duration=4 * 3600)
+        # spread rather than at multiples of the period
+        self.assertGreater(len(set(round(t) for t in reports)), len(reports) / 2)
+        self.assertTrue(200 <= len(reports) <= 260)
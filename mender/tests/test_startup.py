@@ -0,0 +1,54 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import subprocess
+import sys
+import unittest
+
+
+def modules_after_parse(args):
+    """Return modules loaded after parsing `args` in a fresh interpreter"""
+    code = '; '.join([
+        'import sys, json',
+        'from mender.cli import parse_arguments',
+        'parse_arguments({!r})'.format(args),
+        'print(json.dumps(sorted(sys.modules)))',
+    ])
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return set(json.loads(out.decode()))
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def test_lazy_commands(self):
+        mods = modules_after_parse(['user', 'token'])
+        self.assertIn('mender.cli.user', mods)
+        for mod in ['mender.cli.device', 'mender.cli.client', 'mender.cli.deps',
+                    'mender.cli.artifacts']:
+            self.assertNotIn(mod, mods)
+
+    def test_no_heavy_imports(self):
+        for args in [['user', 'token'], ['device', 'token'],
+                     ['artifact', 'list'], ['admission', 'list']]:
+            mods = modules_after_parse(args)
+            self.assertNotIn('Crypto', mods, args)
+            self.assertNotIn('requests_toolbelt', mods, args)
@@ -0,0 +1,75 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import unittest
+
+from mender.cli import synthetic
+
+
+class InventoryTemplateTestCase(unittest.TestCase):
+
+    def test_attributes(self):
+        tmpl = synthetic.InventoryTemplate({
+            'device_type': 'foo',
+            'serial': {'format': 'SN{index:04d}'},
+            'mac': '{mac}',
+            'ip': {'ipv4': '10.0.0.0/24'},
+            'mem': {'int': [1, 4]},
+            'hash': {'hex': 20},
+            'os': {'choice': ['a', 'b'], 'weights': [3, 1]},
+        })
+        attrs = dict((a['name'], a['value']) for a in tmpl.attributes(7, 'de:ad', seed=1))
+        self.assertEqual(attrs['device_type'], 'foo')
+        self.assertEqual(attrs['serial'], 'SN0007')
+        self.assertEqual(attrs['mac'], 'de:ad')
+        self.assertEqual(attrs['ip'], '10.0.0.8')
+        self.assertIn(attrs['mem'], range(1, 5))
+        self.assertEqual(len(attrs['hash']), 20)
+
+        # reproducible, but differs between seeds
+        self.assertEqual(tmpl.attributes(7, 'de:ad', seed=1), tmpl.attributes(7, 'de:ad', seed=1))
+        self.assertNotEqual([tmpl.attributes(i, seed=1)[5] for i in range(10)],
+                            [tmpl.attributes(i, seed=2)[5] for i in range(10)])
+
+        counts = collections.Counter(tmpl.attributes(i)[6]['value'] for i in range(4000))
+        self.assertTrue(2700 < counts['a'] < 3300, counts)
+
+    def test_shared(self):
+        tmpl = synthetic.load_template('realistic')
+        self.assertIs(tmpl, synthetic.load_template('realistic'))
+        first = tmpl.attributes(1)
+        second = tmpl.attributes(2)
+        # choice values are shared
+        self.assertIs(first[0]['name'], second[0]['name'])
+        self.assertNotEqual(first[11]['value'], second[11]['value'])
+
+    def test_invalid(self):
+        for spec in [[], {'a': {'foo': 1}}, {'a': {'choice': []}},
+                     {'a': {'choice': ['x'], 'weights': [1, 2]}},
+                     {'a': {'choice': ['x'], 'weights': ['1']}},
+                     {'a': {'int': 5}}, {'a': {'int': [5, 1]}}, {'a': {'int': [1, 'x']}},
+                     {'a': {'hex': 'x'}}, {'a': {'hex': 0}},
+                     {'a': {'ipv4': 'nope'}}, {'a': {'ipv4': '10.0.0.1/8'}},
+                     {'a': {'format': 5}}, {'a': {'format': 'x{foo}'}},
+                     {'a': {'format': '{index:s}'}}, {'a': 'x{0}'}]:
+            with self.assertRaises(synthetic.TemplateError):
+                synthetic.InventoryTemplate(spec)
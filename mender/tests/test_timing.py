@@ -0,0 +1,100 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import socket
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import requests
+
+from mender.cli import client, profiling
+from mender.client import timing
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TimingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://localhost:{}/'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.session = requests.Session()
+        self.session.mount('http://', timing.TimingAdapter(timing=True))
+        self.addCleanup(self.session.close)
+
+    def listen(self, listener):
+        timing.listeners.append(listener)
+        self.addCleanup(timing.listeners.remove, listener)
+
+    def test_listeners(self):
+        stats = client.FleetStats()
+        self.listen(stats.record_timings)
+        self.assertIsNone(stats.timing_summary())
+
+        for _ in range(2):
+            self.assertEqual(self.session.get(self.url).status_code, 200)
+        summary = stats.timing_summary()
+        self.assertEqual(stats.timed, 2)
+        # second request goes over the same connection
+        self.assertEqual(summary['reused'], 0.5)
+        self.assertGreater(summary['connect'], 0)
+
+    def test_trace(self):
+        self.listen(profiling.trace_timings)
+        profiling.tracer = profiling.Tracer()
+        self.addCleanup(setattr, profiling, 'tracer', None)
+        self.session.get(self.url)
+        names = [e['name'] for e in profiling.tracer.events]
+        self.assertEqual(names[0], 'dns')
+        self.assertIn('ttfb', names)
+        self.assertTrue(all(e['cat'] == 'http' for e in profiling.tracer.events))
+
+    def test_address_fallback(self):
+        getaddrinfo = socket.getaddrinfo
+
+        def resolve(host, *args, **kwargs):
+            if host == 'localhost':
+                # nothing listens on the first one
+                return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (addr, 0))
+                        for addr in ['127.0.0.2', '127.0.0.1']]
+            return getaddrinfo(host, *args, **kwargs)
+
+        with mock.patch('socket.getaddrinfo', resolve):
+            self.assertEqual(self.session.get(self.url).status_code, 200)
@@ -0,0 +1,153 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Maciej Borzecki
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from base64 import urlsafe_b64encode
+
+import mock
+
+from mender.cli import utils
+from mender.tests.helpers import response
+
+
+def make_token(claims):
+    enc = urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+    return 'eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9.' + enc + '.fake-sig'
+
+
+class TokenTestCase(unittest.TestCase):
+
+    def test_pad_b64(self):
+        self.assertEqual(utils.pad_b64('abcd'), 'abcd')
+        self.assertEqual(utils.pad_b64('abc'), 'abc=')
+        self.assertEqual(utils.pad_b64('ab'), 'ab==')
+
+    def test_decode_token(self):
+        header, claims = utils.decode_token(make_token({'sub': 'foo', 'exp': 123}))
+        self.assertEqual(header, {'alg': 'RS256', 'typ': 'JWT'})
+        self.assertEqual(claims, {'sub': 'foo', 'exp': 123})
+
+    def test_token_cache_refresh(self):
+        now = time.time()
+        cache = utils.TokenCache(jitter=0.1)
+        tok = cache.put('foo', make_token({'iat': now - 900, 'exp': now + 100}))
+        self.assertEqual(tok.exp, now + 100)
+        # refresh within the last 10-20% of token lifetime
+        self.assertTrue(now + 100 - 200 <= tok.refresh_at <= now + 100 - 100)
+        self.assertTrue(tok.expiring())
+        self.assertFalse(tok.expiring(now - 200))
+        self.assertIs(cache.get('foo'), tok)
+
+        cache.invalidate('foo')
+        self.assertIsNone(cache.get('foo'))
+
+    def test_token_cache_no_exp(self):
+        cache = utils.TokenCache()
+        self.assertFalse(cache.put('foo', make_token({'sub': 'foo'})).expiring())
+        self.assertFalse(cache.put('bar', 'not-a-token').expiring())
+
+    def test_token_cache_invalidate(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'token')
+        cache = utils.TokenCache()
+        self.assertIsNone(cache.get(path))
+
+        utils.save_file(path, 'first')
+        self.assertEqual(cache.get(path).token, 'first')
+        # the file is not loaded again
+        cache.invalidate(path)
+        self.assertIsNone(cache.get(path))
+
+        # until it is rewritten
+        utils.save_file(path, 'second-token')
+        self.assertEqual(cache.get(path).token, 'second-token')
+        cache.invalidate(path)
+        cache.put(path, 'third')
+        self.assertEqual(cache.get(path).token, 'third')
+
+
+class IterPagesTestCase(unittest.TestCase):
+
+    def test_pages(self):
+        pages = [[1, 2], [3, 4], [5]]
+        requested = []
+
+        def request(method, url, params=None, **kwargs):
+            requested.append(params['page'])
+            return response(200, pages[params['page'] - 1])
+        api = mock.Mock()
+        api.request.side_effect = request
+        self.assertEqual(list(utils.iter_pages(api, 'http://foo', per_page=2)),
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(requested, [1, 2, 3])
+
+    def test_link(self):
+        api = mock.Mock()
+        api.request.side_effect = [response(200, [1, 2], {'Link': '<http://foo?page=2>; rel="next"'}),
+                                   response(200, [3, 4], {'Link': '<http://foo?page=1>; rel="first"'})]
+        self.assertEqual(list(utils.iter_pages(api, 'http://foo', per_page=2)),
+                         [1, 2, 3, 4])
+        self.assertEqual(api.request.call_args_list[1][0][1], 'http://foo?page=2')
+
+    def test_relative_link(self):
+        api = mock.Mock()
+        api.request.side_effect = [
+            response(200, [1, 2], {'Link': '</api/items?page=2>; rel="next"'},
+                     url='http://foo/api/items?per_page=2&page=1'),
+            # full page, but no more links
+            response(200, [3, 4], url='http://foo/api/items?page=2')]
+        self.assertEqual(list(utils.iter_pages(api, 'http://foo/api/items', per_page=2)),
+                         [1, 2, 3, 4])
+        self.assertEqual(api.request.call_count, 2)
+        self.assertEqual(api.request.call_args_list[1][0][1],
+                         'http://foo/api/items?page=2')
+
+    def test_paging_ignored(self):
+        # full page every time
+        api = mock.Mock()
+        api.request.side_effect = lambda *args, **kwargs: response(200, [1, 2])
+        self.assertEqual(list(utils.iter_pages(api, 'http://foo', per_page=2)), [1, 2])
+        self.assertEqual(api.request.call_count, 2)
+
+
+class WriterTestCase(unittest.TestCase):
+
+    def test_table(self):
+        out = io.StringIO()
+        writer = utils.TableWriter(['id', 'type'], width=4, out=out)
+        writer.write({'id': 'a', 'type': 'foo'})
+        writer.write({'id': 'toolong'})
+        self.assertEqual(out.getvalue().splitlines(),
+                         ['id   type', 'a    foo', 'toolong <undefined>'])
+
+    def test_ndjson(self):
+        out = io.StringIO()
+        writer = utils.NDJSONWriter(out)
+        writer.write({'id': 'a'})
+        writer.write([1])
+        self.assertEqual(out.getvalue(), '{"id": "a"}\n[1]\n')